@@ -1,5 +1,3 @@
-import gc
-
 from stellar import StellarUnicorn
 from picographics import PicoGraphics, DISPLAY_STELLAR_UNICORN as DISPLAY
 
@@ -10,6 +8,57 @@ from worms.life_and_death import LifeAndDeath
 MIN_BRIGHTNESS = 0.2
 START_BRIGHTNESS = 0.3
 
+# Scale the colors in the output lookup tables instead of turning down the panel, which
+# also lets the brightness go below what the panel itself does smoothly
+SOFTWARE_BRIGHTNESS = False
+
+# When a frame runs late, catch up by running extra simulation steps before drawing
+ADAPTIVE_FRAMES = True
+
+# The swarm engine keeps all worms in flat arrays, for when you want hundreds of them.
+SWARM_ENGINE = False
+
+# Give worms a body of this many leds instead of a trail that fades away. Only works with
+# the worm objects, not with SWARM_ENGINE or DUAL_CORE. 0 for fading trails.
+TRAIL_LENGTH = 0
+
+# Fade and draw on the second core while the first one simulates the next frame
+DUAL_CORE = False
+
+# Packed images (bytes or .bin paths on the Pico) to rotate through as the background.
+# Leave empty to keep the logo.
+BACKGROUNDS = []
+
+# Set PROFILE to time every stage of the main loop, call profiler.print_report() from
+# the REPL to see the numbers. PROFILE_OVERLAY also draws them as a bar on the top row.
+PROFILE = False
+PROFILE_OVERLAY = False
+
+# Collect garbage in the time between frames instead of whenever the heap fills up.
+# memory.stats() in the REPL shows how often and how long it collected.
+GC_IN_SLACK = True
+
+# Time the viper, native and pure Python variants of the fade, blend and push loops at
+# startup and use the fastest on this board and firmware
+CALIBRATE_KERNELS = True
+
+# Record what the panel shows, with the random state and button presses, to replay and
+# compare it on the simulator later (python -m simulator.replay). None to not record.
+RECORD_PATH = None
+
+if TRAIL_LENGTH and SWARM_ENGINE:
+    raise ValueError("TRAIL_LENGTH needs the worm objects, turn off SWARM_ENGINE")
+if TRAIL_LENGTH and DUAL_CORE:
+    raise ValueError("TRAIL_LENGTH paints the leds from the simulation core, turn off DUAL_CORE")
+
+# The recorder has to see the random state before anything uses it
+if RECORD_PATH:
+    from worms.recorder import Recorder
+
+    recorder = Recorder(RECORD_PATH)
+    UnicornLeds.recorder = recorder
+    ButtonPresses.recorder = recorder
+
 # these two are the modules already set up by Pimoroni
 stellar = StellarUnicorn()
 graphics = PicoGraphics(DISPLAY)
@@ -17,20 +66,97 @@ graphics = PicoGraphics(DISPLAY)
 # Unicorn leds managed a matrix of virtual leds and manages the merging
 # of colors. Changes are made there, before calling the update method that
 # actually updates the screen.
-unicorn_leds = UnicornLeds(graphics, stellar, min_brightness=MIN_BRIGHTNESS, start_brightness=START_BRIGHTNESS)
+unicorn_leds = UnicornLeds(
+    graphics,
+    stellar,
+    min_brightness=MIN_BRIGHTNESS,
+    start_brightness=START_BRIGHTNESS,
+    adaptive_frames=ADAPTIVE_FRAMES,
+    software_brightness=SOFTWARE_BRIGHTNESS,
+)
+
+if CALIBRATE_KERNELS:
+    from worms.kernels import calibrate, describe
+
+    unicorn_leds.use_kernels(calibrate(unicorn_leds))
+    print("Kernels:", describe(unicorn_leds.kernel_choice))
 
 # Life and death manages the worms and their procreation
-life_and_death = LifeAndDeath(worm_collection, unicorn_leds)
+if SWARM_ENGINE:
+    from worms.worm_swarm import WormSwarm
+
+    life_and_death = WormSwarm(worm_collection, unicorn_leds)
+else:
+    life_and_death = LifeAndDeath(worm_collection, unicorn_leds, trail_length=TRAIL_LENGTH)
 
 buttons = ButtonPresses(stellar, unicorn_leds, life_and_death)
+
+# The optional parts are only imported when they are turned on, every module costs RAM
+backgrounds = None
+if BACKGROUNDS:
+    from worms.backgrounds import BackgroundPlaylist
+
+    backgrounds = BackgroundPlaylist(unicorn_leds, BACKGROUNDS)
+
+memory = None
+if GC_IN_SLACK:
+    from worms.memory import MemoryManager
+
+    memory = MemoryManager()
+    unicorn_leds.scheduler.idle = memory.idle
+
+profiler = None
+if PROFILE:
+    from worms.profiler import FrameProfiler, STAGE_BUTTONS, STAGE_LIFE, STAGE_FADE, STAGE_DRAW
+
+    profiler = FrameProfiler(unicorn_leds, overlay=PROFILE_OVERLAY)
+
+if DUAL_CORE:
+    from worms.pipeline import DualCorePipeline
+
+    # Swarm worms make two led changes a step at most, the head and a red head's body
+    stamps_per_step = 2 * life_and_death.max_worms if SWARM_ENGINE else None
+    pipeline = DualCorePipeline(unicorn_leds, stamps_per_step=stamps_per_step)
+    pipeline.start()
+    while True:
+        for _ in range(unicorn_leds.frame_steps()):
+            life_and_death.handle_life_and_death()
+            pipeline.end_step()
+
+        # Anything that touches the leds directly waits for the render core to finish
+        pipeline.wait_idle()
+        if backgrounds:
+            backgrounds.update()
+        buttons.handle_buttons()
+        pipeline.submit()
+
+        unicorn_leds.wait_for_loop()
+
 while True:
+    if profiler:
+        profiler.start_frame()
+    if backgrounds:
+        backgrounds.update()
     buttons.handle_buttons()
-    life_and_death.handle_life_and_death()
+    if profiler:
+        profiler.mark(STAGE_BUTTONS)
+
+    # Usually one step, more if the last frame ran late and we have to catch up
+    for _ in range(unicorn_leds.frame_steps()):
+        life_and_death.handle_life_and_death()
+        if profiler:
+            profiler.mark(STAGE_LIFE)
+        unicorn_leds.fade_leds()
+        if profiler:
+            profiler.mark(STAGE_FADE)
 
     # And this function finally sends the new worms information to the screen
-    unicorn_leds.update_leds()
+    unicorn_leds.draw_leds()
+    if profiler:
+        profiler.mark(STAGE_DRAW)
+        profiler.end_work()
 
-    # This is the main loop, it waits for the next frame
+    # This is the main loop, it waits for the next frame and collects garbage while waiting
     unicorn_leds.wait_for_loop()
-
-    # gc.collect()
+    if profiler:
+        profiler.end_frame()
@@ -0,0 +1,72 @@
+# Host side stand-ins for the Pimoroni and MicroPython modules the worms use, so the
+# animation can run (and be measured) on a regular computer instead of on a Pico.
+import builtins
+import gc
+import sys
+import time
+import tracemalloc
+
+from simulator import machine, micropython, picographics, stellar
+from simulator.clock import FastForwardClock
+from simulator.stellar import SimulationFinished
+
+# The RP2040 port has roughly this much heap available to scripts
+HEAP_SIZE = 192 * 1024
+
+_installed = None
+
+
+def _mem_alloc():
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return 0
+
+
+def _mem_free():
+    return max(HEAP_SIZE - _mem_alloc(), 0)
+
+
+def _threshold(amount=None):
+    if amount is None:
+        return gc._threshold
+    gc._threshold = amount
+
+
+# Puts the stand-ins in place of the device modules. Width and height pick the panel
+# size, max_frames stops the run (with SimulationFinished) after that many screen updates.
+# on_update and pressed are handed to the simulated StellarUnicorn, see simulator/stellar.py
+def install(width=None, height=None, max_frames=None, clock=None, on_update=None, pressed=()):
+    global _installed
+    clock = clock if clock else FastForwardClock()
+    stellar.configure(width=width, height=height, max_frames=max_frames, on_update=on_update, pressed=pressed)
+    picographics.configure(width=width, height=height)
+
+    sys.modules["stellar"] = stellar
+    sys.modules["picographics"] = picographics
+    sys.modules["machine"] = machine
+    sys.modules["micropython"] = micropython
+    # The firmware lets modules use @micropython.native without importing micropython
+    builtins.micropython = micropython
+    builtins.const = micropython.const
+
+    time.ticks_ms = clock.ticks_ms
+    time.ticks_us = clock.ticks_us
+    time.ticks_diff = clock.ticks_diff
+    time.ticks_add = clock.ticks_add
+    time.sleep_ms = clock.sleep_ms
+    time.sleep_us = clock.sleep_us
+
+    gc.mem_alloc = _mem_alloc
+    gc.mem_free = _mem_free
+    gc._threshold = -1
+    gc.threshold = _threshold
+
+    _installed = clock
+    return clock
+
+
+def installed_clock():
+    return _installed
+
+
+__all__ = ["install", "installed_clock", "FastForwardClock", "SimulationFinished"]
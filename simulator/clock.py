@@ -0,0 +1,49 @@
+import time
+
+# Same wrap around as the MicroPython ticks functions
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+# A clock that only moves when asked to. Sleeping jumps the clock forward instead of
+# waiting, so the main loop runs as fast as the host can manage while the code still
+# sees the time pass it expects. With realtime=True the real elapsed time is added too,
+# which keeps the frame timing honest for profiling.
+class FastForwardClock:
+    def __init__(self, start_us=0, realtime=False):
+        self.now_us = start_us
+        self.realtime = realtime
+        self.real_start = time.perf_counter_ns()
+        self.slept_us = 0
+
+    def elapsed_us(self):
+        if self.realtime:
+            return self.now_us + (time.perf_counter_ns() - self.real_start) // 1000
+        return self.now_us
+
+    def advance_us(self, us):
+        if us > 0:
+            self.now_us += us
+
+    def ticks_us(self):
+        return self.elapsed_us() & TICKS_MAX
+
+    def ticks_ms(self):
+        return (self.elapsed_us() // 1000) & TICKS_MAX
+
+    @staticmethod
+    def ticks_add(ticks, delta):
+        return (ticks + delta) & TICKS_MAX
+
+    @staticmethod
+    def ticks_diff(ticks1, ticks2):
+        return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+    def sleep_ms(self, ms):
+        self.sleep_us(ms * 1000)
+
+    def sleep_us(self, us):
+        if us > 0:
+            self.slept_us += us
+            self.advance_us(us)
@@ -0,0 +1,13 @@
+# Stand-in for the MicroPython machine module
+
+
+class MachineReset(Exception):
+    pass
+
+
+def reset():
+    raise MachineReset()
+
+
+def freq():
+    return 125_000_000
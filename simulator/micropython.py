@@ -0,0 +1,29 @@
+# Stand-in for the MicroPython micropython module. The code emitters are no-ops on the host.
+
+
+def native(function):
+    return function
+
+
+def viper(function):
+    return function
+
+
+def const(value):
+    return value
+
+
+def opt_level(level=None):
+    return 0
+
+
+def mem_info(verbose=False):
+    pass
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def schedule(function, argument):
+    function(argument)
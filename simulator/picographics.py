@@ -0,0 +1,62 @@
+# Stand-in for the Pimoroni picographics module. Keeps the pixels in a bytearray so the
+# host can inspect what the panel would show.
+
+DISPLAY_STELLAR_UNICORN = 1
+DISPLAY_GALACTIC_UNICORN = 2
+DISPLAY_COSMIC_UNICORN = 3
+
+DISPLAY_SIZES = {
+    DISPLAY_STELLAR_UNICORN: (16, 16),
+    DISPLAY_GALACTIC_UNICORN: (53, 11),
+    DISPLAY_COSMIC_UNICORN: (32, 32),
+}
+
+PEN_RGB888 = 3
+
+_config = {"width": None, "height": None}
+
+
+def configure(width=None, height=None):
+    _config["width"] = width
+    _config["height"] = height
+
+
+class PicoGraphics:
+    def __init__(self, display=DISPLAY_STELLAR_UNICORN, pen_type=PEN_RGB888, width=None, height=None):
+        default_width, default_height = DISPLAY_SIZES.get(display, DISPLAY_SIZES[DISPLAY_STELLAR_UNICORN])
+        self.width = width or _config["width"] or default_width
+        self.height = height or _config["height"] or default_height
+        self.buffer = bytearray(self.width * self.height * 3)
+        self.pen = 0
+        self.pens_created = 0
+        self.pixels_drawn = 0
+
+    def get_bounds(self):
+        return self.width, self.height
+
+    def create_pen(self, red, green, blue):
+        self.pens_created += 1
+        return ((red & 0xFF) << 16) | ((green & 0xFF) << 8) | (blue & 0xFF)
+
+    def set_pen(self, pen):
+        self.pen = pen
+
+    def pixel(self, x, y):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            index = (y * self.width + x) * 3
+            self.buffer[index] = (self.pen >> 16) & 0xFF
+            self.buffer[index + 1] = (self.pen >> 8) & 0xFF
+            self.buffer[index + 2] = self.pen & 0xFF
+            self.pixels_drawn += 1
+
+    def clear(self):
+        pen = self.pen
+        for index in range(0, len(self.buffer), 3):
+            self.buffer[index] = (pen >> 16) & 0xFF
+            self.buffer[index + 1] = (pen >> 8) & 0xFF
+            self.buffer[index + 2] = pen & 0xFF
+
+    # Host side only: the color at x, y as an (r, g, b) tuple
+    def get_pixel(self, x, y):
+        index = (y * self.width + x) * 3
+        return self.buffer[index], self.buffer[index + 1], self.buffer[index + 2]
@@ -0,0 +1,160 @@
+# Replays a recording made with worms/recorder.py: runs main.py in the simulator from
+# the recorded rng state, with the recorded button presses and simulation steps, and
+# compares every frame on the simulated panel with the recording. Or compares two
+# recordings frame by frame, for example one made before and one after an optimisation.
+#   python -m simulator.replay run.bin
+#   python -m simulator.replay before.bin --against after.bin
+#
+# Presses are replayed by holding the button down for one frame, so the same button
+# pressed in two frames in a row, or twice in one frame, is seen as one press.
+import os
+from argparse import ArgumentParser
+
+import simulator
+from simulator import SimulationFinished
+from simulator.run import MAIN_PATH, run
+
+# The worms modules need the stand-ins to import, run() installs them again for the run
+simulator.install()
+
+
+class FrameDiff:
+    def __init__(self):
+        self.frames = 0
+        self.mismatched_frames = 0
+        self.first_mismatch = None
+        self.worst_pixels = 0
+        self.rng_diverged_at = None
+
+    def compare(self, frame, expected, actual, expected_state, actual_state):
+        self.frames += 1
+        pixels = 0
+        for index in range(0, len(expected), 3):
+            if expected[index : index + 3] != actual[index : index + 3]:
+                pixels += 1
+        if pixels:
+            self.mismatched_frames += 1
+            if self.first_mismatch is None:
+                self.first_mismatch = frame
+            self.worst_pixels = max(self.worst_pixels, pixels)
+        if self.rng_diverged_at is None and expected_state != actual_state:
+            self.rng_diverged_at = frame
+
+    def matches(self):
+        return self.mismatched_frames == 0 and self.rng_diverged_at is None
+
+    def report(self):
+        return {
+            "frames": self.frames,
+            "mismatched_frames": self.mismatched_frames,
+            "first_mismatch": self.first_mismatch,
+            "worst_pixels": self.worst_pixels,
+            "rng_diverged_at": self.rng_diverged_at,
+        }
+
+
+def panel_pixels(graphics, width, height):
+    pixels = bytearray(width * height * 3)
+    for x in range(width):
+        for y in range(height):
+            index = (x * height + y) * 3
+            pixels[index : index + 3] = bytes(graphics.get_pixel(x, y))
+    return pixels
+
+
+# Reruns main.py against a recording, returns a FrameDiff. The run is recorded too, to
+# /dev/null, so the rng state is compared as the recorder saw it, also on two cores.
+def replay(path, frames=None, main_path=MAIN_PATH):
+    from worms.frame_scheduler import FrameScheduler
+    from worms.recorder import RecordingReader
+
+    reader = RecordingReader.open(path)
+    steps = [frame[3] for frame in reader.frames()]
+    # The reader reuses its pixel buffer, and we look one frame ahead for the buttons
+    recorded = ((number, bytes(pixels), rng_state, steps, buttons) for number, pixels, rng_state, steps, buttons in reader.frames())
+    diff = FrameDiff()
+    # The recorded frame the panel is on now, and the one after it
+    current = next(recorded, None)
+    upcoming = next(recorded, None)
+    state = {"current": current, "upcoming": upcoming, "waits": 0}
+
+    def on_update(unicorn, graphics):
+        from worms.unicorn_leds import UnicornLeds
+
+        frame = state["current"]
+        if frame is None:
+            raise SimulationFinished(unicorn.frames)
+        number, pixels, rng_state, _, _ = frame
+        actual_state = UnicornLeds.recorder.last_state
+        diff.compare(number, pixels, panel_pixels(graphics, reader.width, reader.height), rng_state, actual_state)
+        for button in list(unicorn.pressed):
+            unicorn.release(button)
+        state["current"] = state["upcoming"]
+        state["upcoming"] = next(recorded, None)
+        if state["current"] is not None:
+            for button in state["current"][4]:
+                unicorn.press(button)
+
+    wait = FrameScheduler.wait
+
+    # The host never runs late, so take the catch up steps from the recording. The
+    # wait at the end of frame n sets the steps of frame n + 1.
+    def recorded_wait(scheduler):
+        wait(scheduler)
+        state["waits"] += 1
+        if state["waits"] < len(steps):
+            scheduler.steps = steps[state["waits"]]
+
+    def setup():
+        from worms.fastrand import rng
+
+        rng.setstate(reader.start_state)
+        FrameScheduler.wait = recorded_wait
+
+    try:
+        run(
+            frames=frames,
+            width=reader.width,
+            height=reader.height,
+            main_path=main_path,
+            record=os.devnull,
+            setup=setup,
+            on_update=on_update,
+            pressed=current[4] if current else (),
+        )
+    finally:
+        FrameScheduler.wait = wait
+    return diff
+
+
+# Compares two recordings frame by frame, returns a FrameDiff
+def compare_recordings(expected_path, actual_path):
+    from worms.recorder import RecordingReader
+
+    diff = FrameDiff()
+    expected = RecordingReader.open(expected_path).frames()
+    actual = RecordingReader.open(actual_path).frames()
+    for expected_frame, actual_frame in zip(expected, actual):
+        diff.compare(expected_frame[0], expected_frame[1], actual_frame[1], expected_frame[2], actual_frame[2])
+    return diff
+
+
+if __name__ == "__main__":
+    argparse = ArgumentParser()
+    argparse.add_argument("recording", type=str, help="Recording made with worms/recorder.py")
+    argparse.add_argument("--against", type=str, default=None, help="Compare with this recording instead of rerunning main.py")
+    argparse.add_argument("--frames", type=int, default=None, help="Stop after this many frames")
+    argparse.add_argument("--main", type=str, default=str(MAIN_PATH), help="The main.py the recording was made with")
+    args = argparse.parse_args()
+
+    if args.against:
+        diff = compare_recordings(args.recording, args.against)
+    else:
+        diff = replay(args.recording, args.frames, args.main)
+    report = diff.report()
+    print(f"{report['frames']} frames compared, {report['mismatched_frames']} differ")
+    if report["first_mismatch"] is not None:
+        print(f"First difference at frame {report['first_mismatch']}, at most {report['worst_pixels']} pixels in one frame")
+    if report["rng_diverged_at"] is not None:
+        print(f"Random state diverged at frame {report['rng_diverged_at']}")
+    raise SystemExit(0 if diff.matches() else 1)
@@ -0,0 +1,89 @@
+# Runs main.py on the host with the simulated panel, as fast as possible.
+#   python -m simulator.run --frames 10000 --seed 1
+#   python -m simulator.run --frames 10000 --seed 1 --record run.bin
+import random
+import runpy
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import simulator
+from simulator.clock import FastForwardClock
+from simulator.machine import MachineReset
+
+MAIN_PATH = Path(__file__).resolve().parent.parent / "main.py"
+
+
+# record writes a recording of the run to that path, see worms/recorder.py. setup is
+# called after the simulator is installed and seeded, right before main.py starts.
+# on_update and pressed go to the simulated panel.
+def run(
+    frames=1000,
+    width=None,
+    height=None,
+    seed=None,
+    realtime=False,
+    main_path=MAIN_PATH,
+    record=None,
+    setup=None,
+    on_update=None,
+    pressed=(),
+):
+    clock = FastForwardClock(realtime=realtime)
+    simulator.install(width=width, height=height, max_frames=frames, clock=clock, on_update=on_update, pressed=pressed)
+    if seed is not None:
+        random.seed(seed)
+        from worms.fastrand import rng
+
+        rng.seed(seed)
+    if setup:
+        setup()
+
+    recorder = None
+    if record:
+        from worms.button_presses import ButtonPresses
+        from worms.recorder import Recorder
+        from worms.unicorn_leds import UnicornLeds
+
+        recorder = Recorder(record)
+        UnicornLeds.recorder = recorder
+        ButtonPresses.recorder = recorder
+
+    finished_frames = 0
+    started = time.perf_counter()
+    try:
+        runpy.run_path(str(main_path), run_name="__main__")
+    except simulator.SimulationFinished as finished:
+        finished_frames = finished.args[0]
+    except MachineReset:
+        pass
+    finally:
+        if recorder:
+            recorder.close()
+            UnicornLeds.recorder = None
+            ButtonPresses.recorder = None
+    wall_time = time.perf_counter() - started
+
+    return {
+        "frames": finished_frames,
+        "wall_seconds": wall_time,
+        "frames_per_second": finished_frames / wall_time if wall_time else 0.0,
+        "simulated_seconds": clock.elapsed_us() / 1_000_000,
+    }
+
+
+if __name__ == "__main__":
+    argparse = ArgumentParser()
+    argparse.add_argument("--frames", type=int, default=1000, help="Stop after this many frames")
+    argparse.add_argument("--width", type=int, default=None, help="Width of the simulated panel")
+    argparse.add_argument("--height", type=int, default=None, help="Height of the simulated panel")
+    argparse.add_argument("--seed", type=int, default=None, help="Seed the random generator for a repeatable run")
+    argparse.add_argument("--realtime", action="store_true", help="Let real time pass on the clock as well")
+    argparse.add_argument("--record", type=str, default=None, help="Record the run to this file")
+    args = argparse.parse_args()
+
+    result = run(args.frames, args.width, args.height, args.seed, args.realtime, record=args.record)
+    print(
+        f"{result['frames']} frames in {result['wall_seconds']:.2f}s "
+        f"({result['frames_per_second']:.0f} fps), {result['simulated_seconds']:.1f}s simulated"
+    )
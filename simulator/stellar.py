@@ -0,0 +1,76 @@
+# Stand-in for the Pimoroni stellar module
+
+
+class SimulationFinished(Exception):
+    pass
+
+
+_config = {"width": None, "height": None, "max_frames": None, "on_update": None, "pressed": ()}
+
+
+# on_update(unicorn, graphics) is called on every update, before the frame is counted.
+# pressed are the buttons held down from the start.
+def configure(width=None, height=None, max_frames=None, on_update=None, pressed=()):
+    _config["width"] = width
+    _config["height"] = height
+    _config["max_frames"] = max_frames
+    _config["on_update"] = on_update
+    _config["pressed"] = pressed
+
+
+class StellarUnicorn:
+    WIDTH = 16
+    HEIGHT = 16
+
+    SWITCH_A = 0
+    SWITCH_B = 1
+    SWITCH_C = 3
+    SWITCH_D = 6
+    SWITCH_SLEEP = 27
+    SWITCH_VOLUME_UP = 7
+    SWITCH_VOLUME_DOWN = 8
+    SWITCH_BRIGHTNESS_UP = 21
+    SWITCH_BRIGHTNESS_DOWN = 26
+
+    def __init__(self):
+        self.width = _config["width"] or self.WIDTH
+        self.height = _config["height"] or self.HEIGHT
+        self.max_frames = _config["max_frames"]
+        self.brightness = 0.5
+        self.frames = 0
+        self.pressed = set(_config["pressed"])
+        self.on_update = _config["on_update"]
+        self.last_frame = None
+
+    def set_brightness(self, brightness):
+        self.brightness = min(max(brightness, 0.0), 1.0)
+
+    def get_brightness(self):
+        return self.brightness
+
+    def adjust_brightness(self, delta):
+        self.set_brightness(self.brightness + delta)
+
+    def is_pressed(self, button):
+        return button in self.pressed
+
+    # Host side only: hold a button down, or let go of it
+    def press(self, button):
+        self.pressed.add(button)
+
+    def release(self, button):
+        self.pressed.discard(button)
+
+    def update(self, graphics):
+        self.last_frame = graphics
+        if self.on_update:
+            self.on_update(self, graphics)
+        self.frames += 1
+        if self.max_frames is not None and self.frames >= self.max_frames:
+            raise SimulationFinished(self.frames)
+
+    def clear(self):
+        pass
+
+    def light(self):
+        return 0
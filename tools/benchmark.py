@@ -0,0 +1,164 @@
+# Description: Measures frame throughput of the worms on the host simulator. Runs the
+# life and death simulation and the led fade/draw for a fixed number of frames with a
+# seeded random generator, for a sweep of worm counts, worm classes and panel sizes.
+import json
+import random
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import simulator  # noqa: E402
+
+simulator.install()
+
+from picographics import PicoGraphics  # noqa: E402
+from stellar import StellarUnicorn  # noqa: E402
+from worms.canvas import TiledCanvas  # noqa: E402
+from worms.fastrand import rng  # noqa: E402
+from worms.life_and_death import LifeAndDeath  # noqa: E402
+from worms.unicorn_leds import UnicornLeds  # noqa: E402
+from worms.worm_swarm import WormSwarm  # noqa: E402
+from worms.worms import worm_collection  # noqa: E402
+
+PANEL_SIZES = {"16x16": (16, 16), "32x32": (32, 32), "53x11": (53, 11)}
+# Walls of 16x16 Stellars on one TiledCanvas, as columns x rows
+TILED_PANELS = {"wall2x2": (2, 2), "wall4x2": (4, 2)}
+WORM_COUNTS = [1, 2, 4, 8, 16, 32, 64]
+ENGINES = {"objects": LifeAndDeath, "swarm": WormSwarm}
+
+
+class Benchmark:
+    def __init__(self, frames=500, seed=1, engine="objects", verbose=False, trail_length=0):
+        self.engine = engine
+        self.trail_length = trail_length
+        self.frames = frames
+        self.seed = seed
+        self.verbose = verbose
+
+    def log(self, message):
+        if self.verbose:
+            print(message, file=sys.stderr)
+
+    def build(self, panel, worm_classes, worm_count):
+        random.seed(self.seed)
+        rng.seed(self.seed)
+        if panel in TILED_PANELS:
+            columns, rows = TILED_PANELS[panel]
+            canvas = TiledCanvas.grid([(PicoGraphics(), StellarUnicorn()) for _ in range(columns * rows)], columns)
+            leds = UnicornLeds(canvas, canvas)
+        else:
+            width, height = PANEL_SIZES[panel]
+            leds = UnicornLeds(PicoGraphics(width=width, height=height), StellarUnicorn())
+        if self.trail_length:
+            life_and_death = LifeAndDeath(worm_classes, leds, min_worms_count=worm_count, trail_length=self.trail_length)
+        else:
+            life_and_death = ENGINES[self.engine](worm_classes, leds, min_worms_count=worm_count)
+        for _ in range(worm_count):
+            life_and_death.procreate(always=True)
+        return leds, life_and_death
+
+    def run_frames(self, leds, life_and_death):
+        simulate = fade = draw = 0
+        clock = time.perf_counter_ns
+        for _ in range(self.frames):
+            started = clock()
+            life_and_death.handle_life_and_death()
+            simulated = clock()
+            leds.fade_leds()
+            faded = clock()
+            leds.draw_leds()
+            drawn = clock()
+            simulate += simulated - started
+            fade += faded - simulated
+            draw += drawn - faded
+        return simulate, fade, draw
+
+    # Runs one configuration. Timing and peak memory come from separate runs, because
+    # tracing allocations slows everything down.
+    def run(self, panel, worm_classes, worm_count, measure_memory=True):
+        leds, life_and_death = self.build(panel, worm_classes, worm_count)
+        simulate, fade, draw = self.run_frames(leds, life_and_death)
+        total = simulate + fade + draw
+
+        peak = None
+        if measure_memory:
+            leds, life_and_death = self.build(panel, worm_classes, worm_count)
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.run_frames(leds, life_and_death)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        result = {
+            "panel": panel,
+            "engine": self.engine,
+            "worms": worm_count,
+            "mix": "all" if len(worm_classes) > 1 else worm_classes[0].__name__,
+            "frames": self.frames,
+            "fps": self.frames * 1e9 / total if total else 0.0,
+            "simulate_ms": simulate / 1e6 / self.frames,
+            "fade_ms": fade / 1e6 / self.frames,
+            "draw_ms": draw / 1e6 / self.frames,
+            "peak_bytes": peak,
+            "final_worms": len(life_and_death.worms),
+        }
+        self.log(f"{result['panel']} {result['mix']} x{worm_count}: {result['fps']:.0f} fps")
+        return result
+
+    def sweep(self, panels, mixes, worm_counts, measure_memory=True):
+        results = []
+        for panel in panels:
+            for mix in mixes:
+                for worm_count in worm_counts:
+                    results.append(self.run(panel, mix, worm_count, measure_memory))
+        return results
+
+
+def worm_mixes(mix):
+    if mix == "all":
+        return [list(worm_collection)]
+    if mix == "each":
+        return [list(worm_collection)] + [[worm_class] for worm_class in worm_collection]
+    by_name = {worm_class.__name__: worm_class for worm_class in worm_collection}
+    return [[by_name[name] for name in mix.split(",")]]
+
+
+def print_table(results):
+    print(f"{'panel':<7} {'mix':<13} {'worms':>5} {'fps':>8} {'sim ms':>7} {'fade ms':>7} {'draw ms':>7} {'peak KB':>8}")
+    for result in results:
+        peak = f"{result['peak_bytes'] / 1024:.1f}" if result["peak_bytes"] is not None else "-"
+        print(
+            f"{result['panel']:<7} {result['mix']:<13} {result['worms']:>5} {result['fps']:>8.0f} "
+            f"{result['simulate_ms']:>7.3f} {result['fade_ms']:>7.3f} {result['draw_ms']:>7.3f} {peak:>8}"
+        )
+
+
+if __name__ == "__main__":
+    argparse = ArgumentParser()
+    argparse.add_argument("--frames", type=int, default=500, help="Frames to run per configuration")
+    argparse.add_argument("--seed", type=int, default=1, help="Seed for the random generator")
+    argparse.add_argument("--panels", type=str, default=",".join(PANEL_SIZES), help=f"Comma separated panel sizes, or tiled walls: {', '.join(TILED_PANELS)}")
+    argparse.add_argument("--worms", type=str, default=",".join(str(count) for count in WORM_COUNTS), help="Comma separated worm counts")
+    argparse.add_argument("--mix", type=str, default="all", help="'all', 'each', or comma separated worm class names")
+    argparse.add_argument("--engine", choices=list(ENGINES), default="objects", help="Worm objects or the array based swarm")
+    argparse.add_argument("--trails", type=int, default=0, help="Worms with a body of this many leds, objects engine only")
+    argparse.add_argument("--no-memory", action="store_true", help="Skip the peak allocation runs")
+    argparse.add_argument("--json", action="store_true", help="Print the results as JSON")
+    argparse.add_argument("--verbose", action="store_true", help="Print progress")
+
+    args = argparse.parse_args()
+    benchmark = Benchmark(frames=args.frames, seed=args.seed, engine=args.engine, verbose=args.verbose, trail_length=args.trails)
+    results = benchmark.sweep(
+        args.panels.split(","),
+        worm_mixes(args.mix),
+        [int(count) for count in args.worms.split(",")],
+        measure_memory=not args.no_memory,
+    )
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
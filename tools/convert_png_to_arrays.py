@@ -1,9 +1,54 @@
-# Description: Converts a PNG / JPG whatever file to a dictionary or array of arrays of RGB values
+# Description: Converts a PNG / JPG whatever file to a dictionary or array of arrays of RGB values,
+# or to a packed image (see worms/packed_image.py) that UnicornLeds can load as its background.
+# The frames of an animated GIF, or a list of images, pack into one animated packed image
+# for BackgroundPlaylist.
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
 from pathlib import Path
 
+import hashlib
+import json
 import sys
-from PIL import Image
+from PIL import Image, ImageSequence
+
+# NumPy makes reordering the pixels a lot faster, but is not required
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import simulator  # noqa: E402
+
+# The worms modules need the stand-ins to import
+simulator.install()
+
+from worms.packed_image import FORMAT_RGB565, FORMAT_RGB888, pack_header  # noqa: E402
+
+OUTPUT_FORMATS = ["list", "dict", "rgb888", "rgb565", "python"]
+OUTPUT_SUFFIXES = {
+    "list": ".list.txt",
+    "dict": ".dict.txt",
+    "rgb888": ".bin",
+    "rgb565": ".565.bin",
+    "python": ".py",
+}
+PACKED_FORMATS = {"rgb888", "rgb565", "python"}
+# The packed header stores the width and height in a byte each, the frame count in two
+MAX_PACKED_SIZE = 255
+MAX_PACKED_FRAMES = 65535
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp"}
+CACHE_FILE = ".convert_cache.json"
+
+
+def check_packed_size(width, height, name="image"):
+    if width > MAX_PACKED_SIZE or height > MAX_PACKED_SIZE:
+        raise ValueError(
+            f"{name} is {width}x{height}, packed images can be at most {MAX_PACKED_SIZE}x{MAX_PACKED_SIZE}, "
+            "use --resize-width and --resize-height"
+        )
 
 
 class PNGConverter:
@@ -21,7 +66,7 @@ class PNGConverter:
             return True
         return False
 
-    def convert_to_iterable(self, resize_width: int = 16, resize_height: int = 16, return_dict=True):
+    def prepare_image(self, resize_width: int = 16, resize_height: int = 16):
         image = PNGConverter.load_image(self.file)
         resize_height = int(resize_height) if resize_height else image.height
         resize_width = int(resize_width) if resize_width else image.width
@@ -29,18 +74,99 @@ class PNGConverter:
             self.log(f"Image currently {image.width}x{image.height}")
             self.log(f"Resizing image to {resize_width}x{resize_height}")
             image = self.resize_image(image, resize_width, resize_height)
+        return image
+
+    def convert_to_iterable(self, resize_width: int = 16, resize_height: int = 16, return_dict=True):
+        image = self.prepare_image(resize_width, resize_height)
         if return_dict:
             rgb_dict = self.convert_image_to_rgb_dict(image)
         else:
             rgb_dict = self.convert_image_to_rgb_arrays(image)
         return rgb_dict
 
+    def convert_to_packed(self, resize_width: int = 16, resize_height: int = 16, pixel_format=FORMAT_RGB888):
+        image = self.prepare_image(resize_width, resize_height)
+        return self.convert_image_to_packed(image, pixel_format)
+
+    # Converts straight from the image bytes to a packed image, without going through lists
+    def convert_image_to_packed(self, image: Image, pixel_format=FORMAT_RGB888):
+        check_packed_size(image.width, image.height, str(self.file))
+        return pack_header(pixel_format, image.width, image.height) + self.pack_pixels(image, pixel_format)
+
+    # One frame of a packed image, the pixels without the header
+    def pack_pixels(self, image: Image, pixel_format=FORMAT_RGB888):
+        if numpy is None:
+            return PNGConverter.pack_rgb_arrays(self.convert_image_to_rgb_arrays(image), pixel_format)
+        columns = PNGConverter.panel_order(image)
+        if pixel_format == FORMAT_RGB888:
+            return columns.tobytes()
+        rgb = columns.astype(numpy.uint16)
+        pixels = ((rgb[..., 0] >> 3) << 11) | ((rgb[..., 1] >> 2) << 5) | (rgb[..., 2] >> 3)
+        return pixels.astype(">u2").tobytes()
+
+    # Packs images of the same size as the frames of one animated packed image
+    def convert_frames_to_packed(self, images, pixel_format=FORMAT_RGB888):
+        width = images[0].width
+        height = images[0].height
+        check_packed_size(width, height, str(self.file))
+        if len(images) > MAX_PACKED_FRAMES:
+            raise ValueError(f"{self.file} has {len(images)} frames, packed images can have at most {MAX_PACKED_FRAMES}")
+        frames = [pack_header(pixel_format, width, height, len(images))]
+        for image in images:
+            frames.append(self.pack_pixels(image, pixel_format))
+        return b"".join(frames)
+
+    # The pixels as a width x height x 3 array, in the order the panel uses: both axes
+    # reversed and column by column. Same order as convert_image_to_rgb_arrays.
+    @staticmethod
+    def panel_order(image: Image):
+        pixels = numpy.frombuffer(image.tobytes(), dtype=numpy.uint8).reshape(image.height, image.width, 3)
+        return numpy.ascontiguousarray(pixels[::-1, ::-1].transpose(1, 0, 2))
+
+    # Packs [x][y][rgb] arrays column by column, into the pixels of one frame
+    @staticmethod
+    def pack_rgb_arrays(rgb_arrays, pixel_format=FORMAT_RGB888):
+        packed = bytearray()
+        for column in rgb_arrays:
+            for red, green, blue in column:
+                if pixel_format == FORMAT_RGB888:
+                    packed += bytes((red, green, blue))
+                else:
+                    pixel = ((red >> 3) << 11) | ((green >> 2) << 5) | (blue >> 3)
+                    packed += bytes((pixel >> 8, pixel & 0xFF))
+        return bytes(packed)
+
+    # A python module with the packed image as a bytes literal, ready to be frozen into flash
+    @staticmethod
+    def packed_to_python(packed, name, chunk=48):
+        lines = [
+            "# Packed RGB888 images, see worms/packed_image.py for the format. Made with",
+            "# tools/convert_png_to_arrays.py --output-format python. Frozen into the firmware,",
+            "# these bytes stay in flash and are used from there without being copied.",
+            f"{name} = (",
+        ]
+        for start in range(0, len(packed), chunk):
+            lines.append('    b"' + "".join(f"\\x{byte:02x}" for byte in packed[start:start + chunk]) + '"')
+        lines.append(")")
+        return "\n".join(lines) + "\n"
+
     def load_image(file):
         img = Image.open(file)
         img = img.convert("RGB")
         img.load()
         return img
 
+    # Every frame of an animated GIF, APNG or WebP, and how long it shows in milliseconds
+    @staticmethod
+    def load_animation(file):
+        frames = []
+        durations = []
+        with Image.open(file) as animation:
+            for frame in ImageSequence.Iterator(animation):
+                frames.append(frame.convert("RGB"))
+                durations.append(frame.info.get("duration", 0))
+        return frames, durations
+
     def resize_image(self, image, width, height):
         return image.resize((width, height))
 
@@ -56,26 +182,165 @@ class PNGConverter:
 
     def convert_image_to_rgb_dict(self, image : Image):
         rgb_dict = {}
+        pixels = image.tobytes()
         for x in range(image.width):
             for y in range(image.height):
-                rgb = image.getpixel([x, y])
-                rgb_dict[(x, y)] = rgb
+                index = (y * image.width + x) * 3
+                rgb_dict[(x, y)] = (pixels[index], pixels[index + 1], pixels[index + 2])
         return rgb_dict
 
     def convert_image_to_rgb_arrays(self, image : Image):
+        if numpy is not None:
+            return PNGConverter.panel_order(image).tolist()
         rgb_arrays = []
-        indexes_x = list(range(image.width))
-        indexes_x.reverse()
-        for x in indexes_x:
+        pixels = image.tobytes()
+        for x in range(image.width - 1, -1, -1):
             row = []
-            indexes_y = list(range(image.height))
-            indexes_y.reverse()
-            for y in indexes_y:
-                rgb = image.getpixel([x, y])
-                row.append(list(rgb))
+            for y in range(image.height - 1, -1, -1):
+                index = (y * image.width + x) * 3
+                row.append([pixels[index], pixels[index + 1], pixels[index + 2]])
             rgb_arrays.append(row)
         return rgb_arrays
 
+    # Resizes the frames to the requested size, or to the size of the first frame
+    def prepare_frames(self, frames, resize_width=0, resize_height=0):
+        resize_width = int(resize_width) if resize_width else frames[0].width
+        resize_height = int(resize_height) if resize_height else frames[0].height
+        self.log(f"{len(frames)} frames of {frames[0].width}x{frames[0].height}, packed at {resize_width}x{resize_height}")
+        return [
+            self.resize_image(frame, resize_width, resize_height) if self.resize_needed(frame, resize_width, resize_height) else frame
+            for frame in frames
+        ]
+
+    # Packs all frames of the animated --file, or the images in frame_files, into one
+    # animated packed image
+    def convert_animation(self, output_format, resize_width=0, resize_height=0, name="logo", frame_files=None):
+        if output_format not in PACKED_FORMATS:
+            raise ValueError(f"Animations can only be packed, not written as {output_format}")
+        if frame_files:
+            frames = [PNGConverter.load_image(file) for file in frame_files]
+        else:
+            frames, durations = PNGConverter.load_animation(self.file)
+            if any(durations):
+                self.log(f"Frames show for {sum(durations) // len(durations)} ms on average, use that as frame_ms")
+        pixel_format = FORMAT_RGB565 if output_format == "rgb565" else FORMAT_RGB888
+        packed = self.convert_frames_to_packed(self.prepare_frames(frames, resize_width, resize_height), pixel_format)
+        if output_format == "python":
+            return PNGConverter.packed_to_python(packed, name)
+        return packed
+
+    def convert(self, output_format, resize_width: int = 16, resize_height: int = 16, name="logo"):
+        if output_format in ("list", "dict"):
+            return str(self.convert_to_iterable(resize_width, resize_height, return_dict=output_format == "dict"))
+        pixel_format = FORMAT_RGB565 if output_format == "rgb565" else FORMAT_RGB888
+        packed = self.convert_to_packed(resize_width, resize_height, pixel_format)
+        if output_format == "python":
+            return PNGConverter.packed_to_python(packed, name)
+        return packed
+
+
+# Converts a whole directory or glob of images in parallel. Every image is written in
+# every requested format to the output directory. Images whose content and options did
+# not change since the last run are skipped, based on a hash cache in the output directory.
+class BatchConverter:
+    def __init__(self, output_dir, formats, resize_width=16, resize_height=16, jobs=None, verbose=False):
+        self.output_dir = Path(output_dir)
+        self.formats = formats
+        self.resize_width = resize_width
+        self.resize_height = resize_height
+        self.jobs = jobs
+        self.verbose = verbose
+        self.cache_path = self.output_dir / CACHE_FILE
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    @staticmethod
+    def find_images(pattern):
+        path = Path(pattern)
+        if path.is_dir():
+            files = [file for file in sorted(path.iterdir()) if file.suffix.lower() in IMAGE_SUFFIXES]
+        else:
+            files = [Path(file) for file in sorted(glob(pattern, recursive=True))]
+        return [file for file in files if file.is_file()]
+
+    def content_hash(self, file):
+        digest = hashlib.sha256()
+        digest.update(f"{self.resize_width}x{self.resize_height}:{','.join(self.formats)}".encode())
+        digest.update(file.read_bytes())
+        return digest.hexdigest()
+
+    def load_cache(self):
+        if self.cache_path.exists():
+            with open(self.cache_path) as cache_file:
+                return json.load(cache_file)
+        return {}
+
+    def save_cache(self, cache):
+        with open(self.cache_path, "w") as cache_file:
+            json.dump(cache, cache_file, indent=1, sort_keys=True)
+
+    # The size every image ends up at, checked before any worker starts
+    def check_sizes(self, files):
+        if not PACKED_FORMATS.intersection(self.formats):
+            return
+        for file in files:
+            with Image.open(file) as image:
+                width, height = image.size
+            check_packed_size(self.resize_width or width, self.resize_height or height, file)
+
+    def outputs_for(self, file):
+        return [self.output_dir / (file.stem + OUTPUT_SUFFIXES[output_format]) for output_format in self.formats]
+
+    def run(self, pattern):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        cache = self.load_cache()
+        todo = []
+        skipped = 0
+        for file in self.find_images(pattern):
+            content_hash = self.content_hash(file)
+            outputs_exist = all(output.exists() for output in self.outputs_for(file))
+            if cache.get(str(file)) == content_hash and outputs_exist:
+                skipped += 1
+                continue
+            todo.append((str(file), content_hash))
+
+        self.check_sizes([file for file, _ in todo])
+        self.log(f"{len(todo)} images to convert, {skipped} unchanged")
+        jobs = [(file, str(self.output_dir), self.formats, self.resize_width, self.resize_height) for file, _ in todo]
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            for (file, content_hash), written in zip(todo, executor.map(convert_one, jobs)):
+                cache[file] = content_hash
+                self.log(f"{file} -> {', '.join(written)}")
+        self.save_cache(cache)
+        return len(todo), skipped
+
+
+# Worker for the process pool, converts one image to all requested formats
+def convert_one(job):
+    file, output_dir, formats, resize_width, resize_height = job
+    converter = PNGConverter(file=file)
+    image = converter.prepare_image(resize_width, resize_height)
+    name = Path(file).stem.replace("-", "_").replace(" ", "_").replace(".", "_")
+    written = []
+    for output_format in formats:
+        if output_format == "list":
+            output = str(converter.convert_image_to_rgb_arrays(image))
+        elif output_format == "dict":
+            output = str(converter.convert_image_to_rgb_dict(image))
+        else:
+            pixel_format = FORMAT_RGB565 if output_format == "rgb565" else FORMAT_RGB888
+            output = converter.convert_image_to_packed(image, pixel_format)
+            if output_format == "python":
+                output = PNGConverter.packed_to_python(output, name)
+        output_path = Path(output_dir) / (Path(file).stem + OUTPUT_SUFFIXES[output_format])
+        mode = "wb" if isinstance(output, bytes) else "w"
+        with open(output_path, mode) as output_file:
+            output_file.write(output)
+        written.append(str(output_path))
+    return written
+
 
 if __name__ == "__main__":
     argparse = ArgumentParser()
@@ -83,10 +348,58 @@ if __name__ == "__main__":
     argparse.add_argument("--resize-width", type=int, default=0, help="The resized width of the image")
     argparse.add_argument("--resize-height", type=int, default=0, help="The resized height of the image")
     argparse.add_argument("--return-dict", action="store_true", default=False, help="Return a dictionary instead of an array of arrays")
+    argparse.add_argument("--output-format", choices=OUTPUT_FORMATS, default=None, help="Output as list, dict, packed rgb888/rgb565 .bin, or a python module with packed bytes")
+    argparse.add_argument("--output", type=str, default=None, help="Write the output to this file instead of printing it")
+    argparse.add_argument("--name", type=str, default="logo", help="Variable name for the python output format")
+    argparse.add_argument("--animation", action="store_true", help="Pack every frame of an animated --file (GIF, APNG, WebP) into one packed image")
+    argparse.add_argument("--frames", type=str, default=None, help="Pack the images in this directory or glob pattern, in name order, as the frames of one packed image")
+    argparse.add_argument("--batch", type=str, default=None, help="Convert every image in this directory or glob pattern")
+    argparse.add_argument("--output-dir", type=str, default="converted", help="Where batch mode writes its output")
+    argparse.add_argument("--formats", type=str, default="rgb888", help="Comma separated output formats for batch mode")
+    argparse.add_argument("--jobs", type=int, default=None, help="Number of worker processes for batch mode")
     argparse.add_argument("--verbose", action="store_true", help="Print verbose output")
 
 
     args = argparse.parse_args()
-    converter = PNGConverter(file=args.file, verbose=args.verbose)
-    rgb_arrays = converter.convert_to_iterable(args.resize_width, args.resize_height, return_dict=args.return_dict)
-    print(rgb_arrays)
+    if args.batch:
+        formats = args.formats.split(",")
+        unknown = [output_format for output_format in formats if output_format not in OUTPUT_FORMATS]
+        if unknown:
+            print(f"Unknown formats: {', '.join(unknown)}")
+            sys.exit(1)
+        batch = BatchConverter(
+            args.output_dir, formats, args.resize_width, args.resize_height, jobs=args.jobs, verbose=args.verbose
+        )
+        try:
+            converted, skipped = batch.run(args.batch)
+        except ValueError as error:
+            print(error)
+            sys.exit(1)
+        print(f"Converted {converted} images, skipped {skipped} unchanged")
+        sys.exit(0)
+
+    output_format = args.output_format or ("dict" if args.return_dict else "list")
+    frame_files = BatchConverter.find_images(args.frames) if args.frames else None
+    if args.frames and not frame_files:
+        print(f"No images found for {args.frames}")
+        sys.exit(1)
+    converter = PNGConverter(file=frame_files[0] if frame_files else args.file, verbose=args.verbose)
+    try:
+        if args.animation or frame_files:
+            output = converter.convert_animation(output_format, args.resize_width, args.resize_height, args.name, frame_files)
+        else:
+            output = converter.convert(output_format, args.resize_width, args.resize_height, args.name)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+
+    if args.output:
+        mode = "wb" if isinstance(output, bytes) else "w"
+        with open(args.output, mode) as output_file:
+            output_file.write(output)
+        converter.log(f"Written to {args.output}")
+    elif isinstance(output, bytes):
+        print("Packed formats need --output")
+        sys.exit(1)
+    else:
+        print(output)
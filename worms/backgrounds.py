@@ -0,0 +1,109 @@
+import time
+
+from worms.packed_image import PackedImageFile, open_packed_image
+
+
+# One image in a playlist. Animated images (packed images with more than one frame)
+# show a new frame every frame_ms. After hold_ms the playlist cross-fades to the next
+# image in fade_ms.
+class BackgroundEntry:
+    def __init__(self, source, hold_ms=30000, frame_ms=100, fade_ms=2000):
+        self.source = source
+        self.hold_ms = hold_ms
+        self.frame_ms = frame_ms
+        self.fade_ms = fade_ms
+
+
+# Mixes two RGB888 buffers into out. Weight runs from 0 (all of a) to 256 (all of b).
+@micropython.native
+def blend_pixels(a, b, out, weight):
+    inverse = 256 - weight
+    for i in range(len(out)):
+        out[i] = (a[i] * inverse + b[i] * weight) >> 8
+
+
+# Rotates the UnicornLeds background through a list of images. Only the frame on show is
+# in memory: frames of .bin files are read from flash one at a time and frozen bytes are
+# used in place. Call update() once per frame, it only does real work when the background
+# has to change, and a cross-fade is spread over fade_steps changes.
+class BackgroundPlaylist:
+    def __init__(self, leds, entries, fade_steps=16):
+        self.leds = leds
+        self.entries = [entry if isinstance(entry, BackgroundEntry) else BackgroundEntry(entry) for entry in entries]
+        self.fade_steps = fade_steps
+        self.entry_index = 0
+        self.image = None
+        self.next_image = None
+        self.frame_index = 0
+        self.fade_step = 0
+        self.fading = False
+        # Only needed for cross-fading, sized on first use
+        self.fade_from = None
+        self.fade_buffer = None
+        self.show(0)
+
+    def current_entry(self):
+        return self.entries[self.entry_index]
+
+    def show(self, entry_index):
+        self.close_image(self.image)
+        self.entry_index = entry_index
+        self.image = open_packed_image(self.current_entry().source)
+        self.frame_index = 0
+        self.show_frame(self.image.frame(0))
+        self.entry_started = time.ticks_ms()
+        self.frame_started = self.entry_started
+
+    def show_frame(self, pixels):
+        self.leds.set_background(pixels, self.image.width, self.image.height)
+
+    @staticmethod
+    def close_image(image):
+        if isinstance(image, PackedImageFile):
+            image.close()
+
+    @micropython.native
+    def update(self):
+        now = time.ticks_ms()
+        entry = self.current_entry()
+        if self.fading:
+            self.update_fade(now)
+        elif len(self.entries) > 1 and time.ticks_diff(now, self.entry_started) >= entry.hold_ms:
+            self.start_fade(now)
+        elif self.image.frames > 1 and time.ticks_diff(now, self.frame_started) >= entry.frame_ms:
+            self.frame_index = (self.frame_index + 1) % self.image.frames
+            self.show_frame(self.image.frame(self.frame_index))
+            self.frame_started = now
+
+    def start_fade(self, now):
+        next_index = (self.entry_index + 1) % len(self.entries)
+        self.next_image = open_packed_image(self.entries[next_index].source)
+        if self.next_image.width != self.image.width or self.next_image.height != self.image.height:
+            # Images of different sizes can not be mixed, just switch over
+            self.close_image(self.next_image)
+            self.next_image = None
+            self.show(next_index)
+            return
+        size = self.image.width * self.image.height * 3
+        if self.fade_from is None or len(self.fade_from) != size:
+            self.fade_from = bytearray(size)
+            self.fade_buffer = bytearray(size)
+        self.fade_from[:] = self.image.frame(self.frame_index)
+        self.fade_step = 0
+        self.fading = True
+        self.fade_started = now
+
+    def update_fade(self, now):
+        fade_ms = self.entries[(self.entry_index + 1) % len(self.entries)].fade_ms
+        step = (time.ticks_diff(now, self.fade_started) * self.fade_steps) // fade_ms if fade_ms > 0 else self.fade_steps
+        if step <= self.fade_step:
+            return
+        if step >= self.fade_steps:
+            self.fading = False
+            self.close_image(self.next_image)
+            self.next_image = None
+            self.show((self.entry_index + 1) % len(self.entries))
+            return
+        self.fade_step = step
+        blend_pixels(self.fade_from, self.next_image.frame(0), self.fade_buffer, (step * 256) // self.fade_steps)
+        self.show_frame(self.fade_buffer)
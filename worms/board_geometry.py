@@ -0,0 +1,80 @@
+from array import array
+
+# Edge bits, a led can touch more than one edge at once
+EDGE_LEFT = 1
+EDGE_RIGHT = 2
+EDGE_TOP = 4
+EDGE_BOTTOM = 8
+EDGE_ANY = EDGE_LEFT | EDGE_RIGHT | EDGE_TOP | EDGE_BOTTOM
+
+# The edge a worm runs into when heading this way, indexed by
+# (x_speed + 1) * 3 + (y_speed + 1) for speeds of -1, 0 and 1
+HEADING_EDGES = bytes(
+    [
+        EDGE_LEFT | EDGE_BOTTOM, EDGE_LEFT, EDGE_LEFT | EDGE_TOP,
+        EDGE_BOTTOM, 0, EDGE_TOP,
+        EDGE_RIGHT | EDGE_BOTTOM, EDGE_RIGHT, EDGE_RIGHT | EDGE_TOP,
+    ]
+)
+
+
+def turn_away(mask, low_edge, high_edge):
+    if mask & low_edge:
+        return 1
+    if mask & high_edge:
+        return -1
+    return 0
+
+
+# Which way a worm has to go after turning, by edge mask: 1 or -1 when an edge
+# forces the direction, 0 when the worm is free to pick one
+TURN_X = tuple(turn_away(mask, EDGE_LEFT, EDGE_RIGHT) for mask in range(EDGE_ANY + 1))
+TURN_Y = tuple(turn_away(mask, EDGE_BOTTOM, EDGE_TOP) for mask in range(EDGE_ANY + 1))
+
+
+# Precomputed edge bits for every led on the panel, so edge checks are a single lookup.
+# Worms stay above height_adjust, so every height_adjust gets its own table, made on
+# first use. Tables are indexed like the UnicornLeds framebuffer: x * height + y.
+class BoardGeometry:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.edge_masks = {}
+        self.coordinates = None
+
+    def edge_mask(self, height_adjust=1):
+        mask = self.edge_masks.get(height_adjust)
+        if mask is None:
+            mask = self.build_edge_mask(height_adjust)
+            self.edge_masks[height_adjust] = mask
+        return mask
+
+    def build_edge_mask(self, height_adjust):
+        mask = bytearray(self.width * self.height)
+        for x in range(self.width):
+            for y in range(self.height):
+                bits = 0
+                if x == 0:
+                    bits |= EDGE_LEFT
+                if x >= self.width - 1:
+                    bits |= EDGE_RIGHT
+                # Rows below height_adjust count as bottom edge too, so a worm that got
+                # pushed down there turns back up instead of running off the panel
+                if y <= height_adjust:
+                    bits |= EDGE_BOTTOM
+                if y >= self.height - 1:
+                    bits |= EDGE_TOP
+                mask[x * self.height + y] = bits
+        return mask
+
+    # The x and y of every led, for code that cannot afford a division per led
+    def led_coordinates(self):
+        if self.coordinates is None:
+            columns = array("H", [0] * (self.width * self.height))
+            rows = array("H", [0] * (self.width * self.height))
+            for x in range(self.width):
+                for y in range(self.height):
+                    columns[x * self.height + y] = x
+                    rows[x * self.height + y] = y
+            self.coordinates = (columns, rows)
+        return self.coordinates
@@ -0,0 +1,71 @@
+import time
+
+from array import array
+
+
+# Small ring buffer of button presses, filled from pin interrupts and drained once per
+# frame. The handlers run as soft interrupts (Pin.irq without hard=True), but still
+# allocate nothing: the buffer, the timestamps and the handlers are all made up front.
+class ButtonEvents:
+    def __init__(self, size=16, debounce_ms=50, max_pin=32):
+        self.events = bytearray(size)
+        self.size = size
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.debounce_ms = debounce_ms
+        # When each button last changed level, pressed or released
+        self.last_edge = array("l", [0] * max_pin)
+        self.handlers = {}
+
+    # Called from the interrupt handler on every edge, with the level of the pin after
+    # it. Only a press (the pin went low) after the button was steady for debounce_ms
+    # counts. Any other edge is bounce or a release, but still restarts the steady time,
+    # so the bounce of letting go of a long press is not taken for a new press.
+    def push(self, button, level=0):
+        now = time.ticks_ms()
+        steady = time.ticks_diff(now, self.last_edge[button]) >= self.debounce_ms
+        self.last_edge[button] = now
+        if level != 0 or not steady:
+            return
+        next_head = (self.head + 1) % self.size
+        if next_head == self.tail:
+            # Full, the main loop is not keeping up. Drop the press.
+            self.dropped += 1
+            return
+        self.events[self.head] = button
+        self.head = next_head
+
+    # The oldest press, or -1 when there is none
+    def pop(self):
+        if self.tail == self.head:
+            return -1
+        button = self.events[self.tail]
+        self.tail = (self.tail + 1) % self.size
+        return button
+
+    # Makes the interrupt handler for a button. Done once per button at start up, so
+    # no closure or bound method is created while running.
+    def handler_for(self, button):
+        handler = self.handlers.get(button)
+        if handler is None:
+            push = self.push
+
+            def handler(pin):
+                push(button, pin.value())
+
+            self.handlers[button] = handler
+        return handler
+
+    # Hooks an interrupt on both edges up to every button, buttons pull the pin low.
+    # Returns False when the board can not do pin interrupts.
+    def attach(self, buttons):
+        try:
+            import machine
+
+            for button in buttons:
+                pin = machine.Pin(button, machine.Pin.IN, machine.Pin.PULL_UP)
+                pin.irq(trigger=machine.Pin.IRQ_FALLING | machine.Pin.IRQ_RISING, handler=self.handler_for(button))
+        except (AttributeError, ImportError, TypeError, ValueError):
+            return False
+        return True
@@ -1,17 +1,33 @@
 import machine
 
+from worms.button_events import ButtonEvents
+
+
 class ButtonPresses:
-    def __init__(self, stellar_unicorn, unicorn_leds, life_and_death):
+    # Set to a Recorder to record every press, see worms/recorder.py
+    recorder = None
+
+    def __init__(self, stellar_unicorn, unicorn_leds, life_and_death, use_irq=True):
         self.stellar_unicorn = stellar_unicorn
-        self.button_map = {
-            stellar_unicorn.SWITCH_A: False,
-            stellar_unicorn.SWITCH_B: False,
-            stellar_unicorn.SWITCH_C: False,
-            stellar_unicorn.SWITCH_D: False,
-        }
+        self.buttons = [
+            stellar_unicorn.SWITCH_A,
+            stellar_unicorn.SWITCH_B,
+            stellar_unicorn.SWITCH_C,
+            stellar_unicorn.SWITCH_D,
+            stellar_unicorn.SWITCH_BRIGHTNESS_UP,
+            stellar_unicorn.SWITCH_BRIGHTNESS_DOWN,
+            stellar_unicorn.SWITCH_SLEEP,
+        ]
+        self.button_map = {button: False for button in self.buttons}
         self.life_and_death = life_and_death
         self.unicorn_leds = unicorn_leds
 
+        # With pin interrupts, presses are queued as they happen and the main loop only
+        # has to look at the queue. Without them (like on the simulator) we poll.
+        self.events = ButtonEvents() if use_irq else None
+        if self.events and not self.events.attach(self.buttons):
+            self.events = None
+
     def is_pressed(self, uni_button):
         result = False
         if (
@@ -26,22 +42,37 @@ class ButtonPresses:
 
     @micropython.native
     def handle_buttons(self):
+        if self.events:
+            button = self.events.pop()
+            while button >= 0:
+                self.handle_press(button)
+                button = self.events.pop()
+        else:
+            for button in self.buttons:
+                if self.is_pressed(button):
+                    self.handle_press(button)
+
+    def handle_press(self, button):
+        if self.recorder is not None:
+            self.recorder.record_button(button)
         # Button A adds a new worm
-        if self.is_pressed(self.stellar_unicorn.SWITCH_A):
+        if button == self.stellar_unicorn.SWITCH_A:
             self.life_and_death.procreate(always=True)
-        # Button B deletes the last added worm
-        if self.is_pressed(self.stellar_unicorn.SWITCH_B):
+        # Button B deletes the youngest worm
+        elif button == self.stellar_unicorn.SWITCH_B:
             self.life_and_death.shoot_worm()
         # Button X slows everything down
-        if self.is_pressed(self.stellar_unicorn.SWITCH_C):
+        elif button == self.stellar_unicorn.SWITCH_C:
             self.unicorn_leds.change_speed(+10)
         # And finally, button y speeds it up again
-        if self.is_pressed(self.stellar_unicorn.SWITCH_D):
+        elif button == self.stellar_unicorn.SWITCH_D:
             self.unicorn_leds.change_speed(-10)
 
-        if self.is_pressed(self.stellar_unicorn.SWITCH_BRIGHTNESS_UP):
+        elif button == self.stellar_unicorn.SWITCH_BRIGHTNESS_UP:
             self.unicorn_leds.change_brightness(0.1)
-        if self.is_pressed(self.stellar_unicorn.SWITCH_BRIGHTNESS_DOWN):
+        elif button == self.stellar_unicorn.SWITCH_BRIGHTNESS_DOWN:
             self.unicorn_leds.change_brightness(-0.1)
-        if self.is_pressed(self.stellar_unicorn.SWITCH_SLEEP):
+        elif button == self.stellar_unicorn.SWITCH_SLEEP:
+            if self.recorder is not None:
+                self.recorder.close()
             machine.reset()
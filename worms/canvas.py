@@ -0,0 +1,76 @@
+from worms.pen_cache import PenCache
+
+NO_TILE = 255
+
+
+# One physical panel in a canvas, with its top left corner at x, y on the canvas
+class Tile:
+    def __init__(self, graphics, unicorn, x=0, y=0, pen_cache_size=32):
+        self.graphics = graphics
+        self.unicorn = unicorn
+        self.x = x
+        self.y = y
+        self.width, self.height = graphics.get_bounds()
+        self.pens = PenCache(graphics, size=pen_cache_size)
+        self.dirty = False
+
+
+# A virtual canvas spanning several panels, for example tiled Stellars or a Galactic next
+# to a Cosmic. It stands in for both the PicoGraphics and the unicorn object that
+# UnicornLeds works with, so worms crawl over the whole canvas and cross from one panel
+# to the next. Pixels are routed to the panel they are on, and update() only pushes the
+# panels that had pixels drawn on them.
+class TiledCanvas:
+    def __init__(self, tiles):
+        self.tiles = tiles
+        self.width = max(tile.x + tile.width for tile in tiles)
+        self.height = max(tile.y + tile.height for tile in tiles)
+        # Which tile every pixel is on, indexed by x * height + y
+        self.tile_map = bytearray([NO_TILE] * (self.width * self.height))
+        for index, tile in enumerate(tiles):
+            for x in range(tile.x, tile.x + tile.width):
+                for y in range(tile.y, tile.y + tile.height):
+                    self.tile_map[x * self.height + y] = index
+        self.pen = 0
+        self.updates = 0
+
+    # Lays out panels of the same size in a grid, row by row
+    @classmethod
+    def grid(cls, panels, columns):
+        tiles = []
+        for index, (graphics, unicorn) in enumerate(panels):
+            width, height = graphics.get_bounds()
+            tiles.append(Tile(graphics, unicorn, (index % columns) * width, (index // columns) * height))
+        return cls(tiles)
+
+    def get_bounds(self):
+        return self.width, self.height
+
+    def create_pen(self, red, green, blue):
+        return (red << 16) | (green << 8) | blue
+
+    def set_pen(self, pen):
+        self.pen = pen
+
+    @micropython.native
+    def pixel(self, x, y):
+        tile_index = self.tile_map[x * self.height + y]
+        if tile_index == NO_TILE:
+            return
+        tile = self.tiles[tile_index]
+        pen = self.pen
+        tile.graphics.set_pen(tile.pens.get_pen(pen >> 16, (pen >> 8) & 0xFF, pen & 0xFF))
+        tile.graphics.pixel(x - tile.x, y - tile.y)
+        tile.dirty = True
+
+    def set_brightness(self, brightness):
+        for tile in self.tiles:
+            tile.unicorn.set_brightness(brightness)
+
+    # Pushes the panels that changed since the last update
+    def update(self, graphics=None):
+        for tile in self.tiles:
+            if tile.dirty:
+                tile.unicorn.update(tile.graphics)
+                tile.dirty = False
+                self.updates += 1
@@ -0,0 +1,50 @@
+# Channel values below this go dark in one fade step
+FADE_FLOOR = 4
+
+
+# 256 entry lookup tables for the per channel math of every frame, so fading and drawing
+# a led is an indexed lookup per channel instead of arithmetic.
+#
+# fade maps a channel value to the value one fade step later. Every step keeps the same
+# fraction of the value, so a trail dims evenly to the eye, where taking the same amount
+# off every step drops through the dark end in a few big jumps. A fade takes about as
+# many steps as taking speed off every step would. red, green and blue map
+# framebuffer values to what is sent to the panel: gamma corrected, scaled by the
+# brightness when that is done in software, and by the white balance. The Pimoroni
+# drivers gamma correct themselves, so gamma defaults to 1.0.
+class ColorTables:
+    def __init__(self, gamma=1.0, white_balance=(1.0, 1.0, 1.0)):
+        self.gamma = gamma
+        self.white_balance = white_balance
+        self.fade = bytearray(256)
+        self.red = bytearray(256)
+        self.green = bytearray(256)
+        self.blue = bytearray(256)
+        self.speed = -1
+        self.brightness = -1.0
+
+    # Only rebuilds when the speed changed
+    def build_fade(self, speed):
+        if speed == self.speed:
+            return False
+        self.speed = speed
+        fade = self.fade
+        steps = -(-255 // speed)
+        factor = (FADE_FLOOR / 255) ** (1 / steps)
+        for value in range(256):
+            fade[value] = 0 if value < FADE_FLOOR else min(int(value * factor + 0.5), value - 1)
+        return True
+
+    # Only rebuilds when the brightness changed
+    def build_output(self, brightness=1.0):
+        if brightness == self.brightness:
+            return False
+        self.brightness = brightness
+        gamma = self.gamma
+        tables = (self.red, self.green, self.blue)
+        for channel in range(3):
+            table = tables[channel]
+            scale = 255 * brightness * self.white_balance[channel]
+            for value in range(256):
+                table[value] = min(int((value / 255) ** gamma * scale + 0.5), 255)
+        return True
@@ -0,0 +1,87 @@
+import random
+import sys
+
+from array import array
+
+# Probabilities are compared as 16 bit integers: a threshold of 65536 is always,
+# 0 is never. Work out thresholds once with threshold() instead of comparing floats.
+ONE = 65536
+HALF = ONE // 2
+
+
+def threshold(probability):
+    return min(max(int(probability * ONE), 0), ONE)
+
+
+# One xorshift32 step on the state in the one element array, returning the top 16 bits.
+# Under viper the state never leaves the machine word, so no integers end up on the
+# heap. The host has no viper, so it gets the same steps in plain Python.
+if sys.implementation.name == "micropython":
+
+    @micropython.viper
+    def next16(state) -> int:
+        s = ptr32(state)
+        x = uint(s[0])
+        x ^= x << 13
+        x ^= x >> 17
+        x ^= x << 5
+        s[0] = x
+        return int(x >> 16)
+
+else:
+
+    def next16(state):
+        x = state[0]
+        x ^= (x << 13) & 0xFFFFFFFF
+        x ^= x >> 17
+        x ^= (x << 5) & 0xFFFFFFFF
+        state[0] = x
+        return x >> 16
+
+
+# Seedable random stream for all worm decisions, so a run can be replayed exactly
+class FastRandom:
+    def __init__(self, seed=None):
+        self.state = array("I", [1])
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(32)
+        # xorshift gets stuck on 0
+        self.state[0] = (seed & 0xFFFFFFFF) or 0x2545F491
+
+    def getstate(self):
+        return self.state[0]
+
+    def setstate(self, state):
+        self.state[0] = state
+
+    def next16(self):
+        return next16(self.state)
+
+    # True with the chance given as a threshold, see threshold()
+    def chance(self, threshold):
+        return next16(self.state) < threshold
+
+    # A number from 0 up to n, for n up to 65536
+    def below(self, n):
+        return next16(self.state) % n
+
+    def randint(self, low, high):
+        return low + next16(self.state) % (high - low + 1)
+
+    def choice(self, sequence):
+        return sequence[next16(self.state) % len(sequence)]
+
+    # Fills an array("H") with random numbers in one go. Pass mask=0xFF for a bytearray.
+    @micropython.native
+    def fill(self, buffer, mask=0xFFFF):
+        state = self.state
+        for i in range(len(buffer)):
+            buffer[i] = next16(state) & mask
+        return buffer
+
+
+# The stream the worms draw from
+rng = FastRandom()
@@ -0,0 +1,69 @@
+import time
+
+
+# Paces the main loop against absolute deadlines, so time spent working is taken off the
+# sleep instead of added to it and the frame rate does not drift. In adaptive mode a
+# frame that overruns makes the next frame run several simulation steps before drawing,
+# so the worms keep the same speed even when drawing is slow.
+class FrameScheduler:
+    def __init__(self, fps, adaptive=False, max_steps=4):
+        self.adaptive = adaptive
+        self.max_steps = max_steps
+        self.frame_us = 1_000_000 // fps
+        self.fps = fps
+        self.deadline = time.ticks_add(time.ticks_us(), self.frame_us)
+        self.steps = 1
+        self.overruns = 0
+        self.skipped_steps = 0
+        self.actual_fps = 0
+        self.window_frames = 0
+        self.window_start = time.ticks_us()
+        # Called with the microseconds left before every frame is due, to put the time
+        # we would sleep to use, see MemoryManager.idle
+        self.idle = None
+
+    def set_fps(self, fps):
+        self.fps = fps
+        self.frame_us = 1_000_000 // fps
+
+    # Sleeps until the next frame is due and works out how many simulation steps
+    # the next frame has to run
+    @micropython.native
+    def wait(self):
+        frame_us = self.frame_us
+        remaining = time.ticks_diff(self.deadline, time.ticks_us())
+        if self.idle is not None and self.idle(remaining):
+            remaining = time.ticks_diff(self.deadline, time.ticks_us())
+        if remaining > 0:
+            time.sleep_us(remaining)
+            self.steps = 1
+            self.deadline = time.ticks_add(self.deadline, frame_us)
+        else:
+            self.overruns += 1
+            # Every full frame we are behind is a simulation step we still owe
+            behind = 1 + (-remaining) // frame_us
+            if behind > self.max_steps:
+                # Too far behind to catch up, start counting again from now
+                behind = self.max_steps
+                self.deadline = time.ticks_add(time.ticks_us(), frame_us)
+            else:
+                self.deadline = time.ticks_add(self.deadline, behind * frame_us)
+            self.steps = behind if self.adaptive else 1
+            self.skipped_steps += self.steps - 1
+        self.count_frame()
+
+    def count_frame(self):
+        self.window_frames += 1
+        elapsed = time.ticks_diff(time.ticks_us(), self.window_start)
+        if elapsed >= 1_000_000:
+            self.actual_fps = (self.window_frames * 1_000_000) // elapsed
+            self.window_frames = 0
+            self.window_start = time.ticks_us()
+
+    def stats(self):
+        return {
+            "target_fps": self.fps,
+            "actual_fps": self.actual_fps,
+            "overruns": self.overruns,
+            "skipped_steps": self.skipped_steps,
+        }
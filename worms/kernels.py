@@ -0,0 +1,245 @@
+import sys
+import time
+
+# The loops every frame spends most of its time in, each in a pure Python and a native
+# variant, plus viper variants from worms/kernels_viper.py on the board. The code
+# emitters are picked at compile time, so every variant needs its own copy of the
+# code. calibrate() times them on the panel at hand and UnicornLeds.use_kernels
+# switches to the fastest. The host only has the pure Python variants.
+#
+# fade(leds, table) fades the hot leds through a fade table and queues them for drawing, returns
+#     (hot_count << 16) | draw_count, see UnicornLeds.fade_leds
+# blend(colors, index, color) adds a color to the framebuffer, saturating at 255
+# push(leds) sends the queued leds through the output tables to graphics, see
+#     UnicornLeds.draw_leds and worms/color_tables.py
+
+ON_BOARD = sys.implementation.name == "micropython"
+
+
+def fade_pure(leds, table):
+    colors = leds.colors
+    background = leds.background
+    hot = leds.hot
+    hot_leds = leds.hot_leds
+    draw_queue = leds.draw_queue
+    draw_count = leds.draw_count
+    still_hot = 0
+    for i in range(leds.hot_count):
+        led = hot_leds[i]
+        if hot[led] & 4:
+            # A trail mode body cell stays as it was painted, it only needs drawing
+            if not hot[led] & 2:
+                hot[led] |= 2
+                draw_queue[draw_count] = led
+                draw_count += 1
+            hot[led] &= 6
+            continue
+        index = led * 3
+        red = max(table[colors[index]], background[index])
+        green = max(table[colors[index + 1]], background[index + 1])
+        blue = max(table[colors[index + 2]], background[index + 2])
+        colors[index] = red
+        colors[index + 1] = green
+        colors[index + 2] = blue
+        if not hot[led] & 2:
+            hot[led] |= 2
+            draw_queue[draw_count] = led
+            draw_count += 1
+        if red == background[index] and green == background[index + 1] and blue == background[index + 2]:
+            hot[led] &= 6
+        else:
+            hot_leds[still_hot] = led
+            still_hot += 1
+    return (still_hot << 16) | draw_count
+
+
+@micropython.native
+def fade_native(leds, table):
+    colors = leds.colors
+    background = leds.background
+    hot = leds.hot
+    hot_leds = leds.hot_leds
+    draw_queue = leds.draw_queue
+    draw_count = leds.draw_count
+    still_hot = 0
+    for i in range(leds.hot_count):
+        led = hot_leds[i]
+        if hot[led] & 4:
+            # A trail mode body cell stays as it was painted, it only needs drawing
+            if not hot[led] & 2:
+                hot[led] |= 2
+                draw_queue[draw_count] = led
+                draw_count += 1
+            hot[led] &= 6
+            continue
+        index = led * 3
+        red = max(table[colors[index]], background[index])
+        green = max(table[colors[index + 1]], background[index + 1])
+        blue = max(table[colors[index + 2]], background[index + 2])
+        colors[index] = red
+        colors[index + 1] = green
+        colors[index + 2] = blue
+        if not hot[led] & 2:
+            hot[led] |= 2
+            draw_queue[draw_count] = led
+            draw_count += 1
+        if red == background[index] and green == background[index + 1] and blue == background[index + 2]:
+            hot[led] &= 6
+        else:
+            hot_leds[still_hot] = led
+            still_hot += 1
+    return (still_hot << 16) | draw_count
+
+
+def blend_pure(colors, index, color):
+    colors[index] = min(colors[index] + color[0], 255)
+    colors[index + 1] = min(colors[index + 1] + color[1], 255)
+    colors[index + 2] = min(colors[index + 2] + color[2], 255)
+
+
+@micropython.native
+def blend_native(colors, index, color):
+    colors[index] = min(colors[index] + color[0], 255)
+    colors[index + 1] = min(colors[index + 1] + color[1], 255)
+    colors[index + 2] = min(colors[index + 2] + color[2], 255)
+
+
+def push_pure(leds):
+    colors = leds.colors
+    graphics = leds.graphics
+    get_pen = leds.pen_map.get_pen
+    red = leds.tables.red
+    green = leds.tables.green
+    blue = leds.tables.blue
+    height = leds.uni_height
+    hot = leds.hot
+    draw_queue = leds.draw_queue
+    for i in range(leds.draw_count):
+        led = draw_queue[i]
+        hot[led] &= 5
+        index = led * 3
+        graphics.set_pen(get_pen(red[colors[index]], green[colors[index + 1]], blue[colors[index + 2]]))
+        graphics.pixel(led // height, led % height)
+
+
+@micropython.native
+def push_native(leds):
+    colors = leds.colors
+    graphics = leds.graphics
+    get_pen = leds.pen_map.get_pen
+    red = leds.tables.red
+    green = leds.tables.green
+    blue = leds.tables.blue
+    height = leds.uni_height
+    hot = leds.hot
+    draw_queue = leds.draw_queue
+    for i in range(leds.draw_count):
+        led = draw_queue[i]
+        hot[led] &= 5
+        index = led * 3
+        graphics.set_pen(get_pen(red[colors[index]], green[colors[index + 1]], blue[colors[index + 2]]))
+        graphics.pixel(led // height, led % height)
+
+
+KERNELS = {
+    "fade": {"pure": fade_pure},
+    "blend": {"pure": blend_pure},
+    "push": {"pure": push_pure},
+}
+
+if ON_BOARD:
+    from worms import kernels_viper
+
+    KERNELS["fade"]["native"] = fade_native
+    KERNELS["fade"]["viper"] = kernels_viper.fade
+    KERNELS["blend"]["native"] = blend_native
+    KERNELS["blend"]["viper"] = kernels_viper.blend
+    KERNELS["push"]["native"] = push_native
+    KERNELS["push"]["viper"] = kernels_viper.push
+
+# What to use before calibrating, the decorators the code had before the kernels
+DEFAULT_CHOICE = {name: "native" if ON_BOARD else "pure" for name in KERNELS}
+
+
+def get_kernel(name, variant):
+    return KERNELS[name][variant]
+
+
+DEFAULT_KERNELS = {name: get_kernel(name, variant) for name, variant in DEFAULT_CHOICE.items()}
+
+
+# Runs setup, then kernel, rounds times, and returns the microseconds spent in kernel
+def time_kernel(kernel, run, setup, rounds):
+    total = 0
+    for _ in range(rounds):
+        setup()
+        started = time.ticks_us()
+        run(kernel)
+        total += time.ticks_diff(time.ticks_us(), started)
+    return total
+
+
+def fastest(name, run, setup, rounds):
+    best = None
+    best_us = 0
+    for variant, kernel in KERNELS[name].items():
+        # One untimed round, so the first variant does not pay for warming up
+        setup()
+        run(kernel)
+        spent = time_kernel(kernel, run, setup, rounds)
+        if best is None or spent < best_us:
+            best = variant
+            best_us = spent
+    return best
+
+
+# Times every variant on a full panel of hot leds and returns the fastest variant per
+# kernel. The framebuffer and hot lists are put back afterwards and every led is queued
+# for drawing, so the next draw paints over the test pixels the push kernels left.
+def calibrate(leds, rounds=5):
+    saved_colors = bytearray(leds.colors)
+    saved_hot = bytearray(leds.hot)
+    saved_hot_leds = leds.hot_leds[:]
+    saved_hot_count = leds.hot_count
+    saved_draw_queue = leds.draw_queue[:]
+    saved_draw_count = leds.draw_count
+
+    def light_all():
+        leds.colors[:] = b"\xff" * len(leds.colors)
+        for led in range(leds.led_count):
+            leds.hot[led] = 0
+        leds.draw_count = 0
+        leds.mark_all_dirty()
+
+    def fade(kernel):
+        counts = kernel(leds, leds.tables.fade)
+        leds.hot_count = counts >> 16
+        leds.draw_count = counts & 0xFFFF
+
+    def queue_all():
+        light_all()
+        fade(DEFAULT_KERNELS["fade"])
+
+    def blend(kernel):
+        colors = leds.colors
+        for index in range(0, len(colors), 3):
+            kernel(colors, index, (8, 8, 8))
+
+    choice = {
+        "fade": fastest("fade", fade, light_all, rounds),
+        "blend": fastest("blend", blend, light_all, rounds),
+        "push": fastest("push", lambda kernel: kernel(leds), queue_all, rounds),
+    }
+
+    leds.colors[:] = saved_colors
+    leds.hot[:] = saved_hot
+    leds.hot_leds[:] = saved_hot_leds
+    leds.hot_count = saved_hot_count
+    leds.draw_queue[:] = saved_draw_queue
+    leds.draw_count = saved_draw_count
+    leds.mark_all_dirty()
+    return choice
+
+
+def describe(choice):
+    return ", ".join(f"{name}: {choice[name]}" for name in KERNELS)
@@ -0,0 +1,86 @@
+# Viper variants of the kernels in worms/kernels.py. Only imported on the board, the
+# host has no viper. Viper has no cheap division, so push looks the coordinates up.
+
+
+@micropython.viper
+def fade(leds, table) -> int:
+    fade_table = ptr8(table)
+    colors = ptr8(leds.colors)
+    background = ptr8(leds.background)
+    hot = ptr8(leds.hot)
+    hot_leds = ptr16(leds.hot_leds)
+    draw_queue = ptr16(leds.draw_queue)
+    draw_count = int(leds.draw_count)
+    hot_count = int(leds.hot_count)
+    still_hot = 0
+    i = 0
+    while i < hot_count:
+        led = int(hot_leds[i])
+        if (int(hot[led]) & 4) != 0:
+            # A trail mode body cell stays as it was painted, it only needs drawing
+            if (int(hot[led]) & 2) == 0:
+                hot[led] = int(hot[led]) | 2
+                draw_queue[draw_count] = led
+                draw_count += 1
+            hot[led] = int(hot[led]) & 6
+            i += 1
+            continue
+        index = led * 3
+        red = int(fade_table[colors[index]])
+        if red < int(background[index]):
+            red = int(background[index])
+        green = int(fade_table[colors[index + 1]])
+        if green < int(background[index + 1]):
+            green = int(background[index + 1])
+        blue = int(fade_table[colors[index + 2]])
+        if blue < int(background[index + 2]):
+            blue = int(background[index + 2])
+        colors[index] = red
+        colors[index + 1] = green
+        colors[index + 2] = blue
+        if (int(hot[led]) & 2) == 0:
+            hot[led] = int(hot[led]) | 2
+            draw_queue[draw_count] = led
+            draw_count += 1
+        if red == int(background[index]) and green == int(background[index + 1]) and blue == int(background[index + 2]):
+            hot[led] = int(hot[led]) & 6
+        else:
+            hot_leds[still_hot] = led
+            still_hot += 1
+        i += 1
+    return (still_hot << 16) | draw_count
+
+
+@micropython.viper
+def blend(colors, index: int, color):
+    buffer = ptr8(colors)
+    red = int(buffer[index]) + int(color[0])
+    green = int(buffer[index + 1]) + int(color[1])
+    blue = int(buffer[index + 2]) + int(color[2])
+    buffer[index] = red if red < 255 else 255
+    buffer[index + 1] = green if green < 255 else 255
+    buffer[index + 2] = blue if blue < 255 else 255
+
+
+@micropython.viper
+def push(leds):
+    colors = ptr8(leds.colors)
+    hot = ptr8(leds.hot)
+    draw_queue = ptr16(leds.draw_queue)
+    columns, rows = leds.geometry.led_coordinates()
+    led_x = ptr16(columns)
+    led_y = ptr16(rows)
+    graphics = leds.graphics
+    get_pen = leds.pen_map.get_pen
+    red = ptr8(leds.tables.red)
+    green = ptr8(leds.tables.green)
+    blue = ptr8(leds.tables.blue)
+    draw_count = int(leds.draw_count)
+    i = 0
+    while i < draw_count:
+        led = int(draw_queue[i])
+        hot[led] = int(hot[led]) & 5
+        index = led * 3
+        graphics.set_pen(get_pen(red[colors[index]], green[colors[index + 1]], blue[colors[index + 2]]))
+        graphics.pixel(led_x[led], led_y[led])
+        i += 1
@@ -1,5 +1,6 @@
-import random
-from worms.worms import Worm
+from worms.population import TargetPopulationPolicy
+from worms.spatial_grid import SpatialGrid
+from worms.trails import Trails
 
 
 class LifeAndDeath:
@@ -8,35 +9,87 @@ class LifeAndDeath:
         worm_collection,
         unicorn_leds,
         min_worms_count=2,
+        max_pool_size=8,
+        policy=None,
+        trail_length=0,
     ):
         self.min_worms_count = min_worms_count
+        # Decides when worms are born and which kind
+        self.policy = policy if policy else TargetPopulationPolicy(min_worms_count)
         self.worms = []
         self.worm_collection = worm_collection
         self.unicorn_leds = unicorn_leds
+        # Shared index of worm positions, so worms can find their neighbours quickly
+        self.grid = SpatialGrid(unicorn_leds.uni_width, unicorn_leds.uni_height)
+        # With a trail length, worms get a body of that many leds instead of a fading trail
+        self.trails = Trails(unicorn_leds, trail_length) if trail_length else None
+        # Dead worms per worm class, waiting to be brought back to life instead of
+        # allocating a new worm for every birth
+        self.max_pool_size = max_pool_size
+        self.worm_pool = {worm_class: [] for worm_class in worm_collection}
+        # Dead worms are swapped out of the list, so it is not in birth order. Every
+        # worm gets the number of its birth to find the youngest one.
+        self.births = 0
 
     def get_random_worm(self):
-        return random.choice(self.worm_collection)(self.unicorn_leds, self.worms)
+        worm_class = self.policy.pick_worm_class(self.worm_collection)
+        pool = self.worm_pool.get(worm_class)
+        if pool:
+            worm = pool.pop()
+            worm.reset()
+            return worm
+        return worm_class(self.unicorn_leds, self.worms, grid=self.grid, trails=self.trails)
+
+    def recycle_worm(self, worm):
+        self.grid.remove(worm)
+        worm.clear_body()
+        pool = self.worm_pool.get(worm.__class__)
+        if pool is None:
+            pool = []
+            self.worm_pool[worm.__class__] = pool
+        if len(pool) < self.max_pool_size:
+            pool.append(worm)
 
     @micropython.native
     def handle_life_and_death(self):
-        for worm in self.worms:
+        worms = self.worms
+        i = 0
+        while i < len(worms):
+            worm = worms[i]
             worm.move()
             if worm.is_dead():
-                self.worms.remove(worm)
+                # Move the last worm into this spot. It has not moved yet this frame,
+                # so it gets its turn in the next round of the loop.
+                last_worm = worms.pop()
+                if last_worm is not worm:
+                    worms[i] = last_worm
+                self.recycle_worm(worm)
+            else:
+                self.grid.update(worm)
+                i += 1
         self.procreate()
 
+    # Takes out the youngest worm
     def shoot_worm(self):
-        if len(self.worms) > 0:
-            self.worms.pop()
+        worms = self.worms
+        if len(worms) == 0:
+            return
+        youngest = 0
+        for i in range(1, len(worms)):
+            if worms[i].birth > worms[youngest].birth:
+                youngest = i
+        worm = worms[youngest]
+        last_worm = worms.pop()
+        if last_worm is not worm:
+            worms[youngest] = last_worm
+        self.recycle_worm(worm)
 
-    # Todo: Worms should have control over procreation themselves
     @micropython.native
     def procreate(self, always=False):
         # Depending on the number of worms, we might not want to procreate
-        birth = True
-        birth_range = range(0, len(self.worms) - self.min_worms_count + 1)
-        for _ in birth_range:
-            birth = birth and random.randint(0, Worm.MAX_AGE) == 1
-
-        if birth or always:
-            self.worms.append(self.get_random_worm())
+        if always or self.policy.wants_birth(len(self.worms)):
+            worm = self.get_random_worm()
+            self.births += 1
+            worm.birth = self.births
+            self.worms.append(worm)
+            self.grid.add(worm)
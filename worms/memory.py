@@ -0,0 +1,93 @@
+import gc
+import time
+
+
+# Keeps garbage collection out of the middle of a frame. Every frame it looks at how
+# much heap the frame used, and when enough garbage piled up it collects in the time
+# the frame scheduler would otherwise sleep away, but only if the collection is
+# expected to fit. gc.threshold is set to what a few frames allocate on top of that, so
+# the allocator only steps in by itself when there was no slack for a while.
+# Hand idle to FrameScheduler.idle to hook it into wait_for_loop.
+class MemoryManager:
+    def __init__(self, headroom_frames=8, collect_fraction=2, min_threshold=4096, max_threshold=64 * 1024, first_estimate_us=3000):
+        # How many frames of allocations gc.threshold leaves room for
+        self.headroom_frames = headroom_frames
+        # Collect in slack once 1 / collect_fraction of the threshold is used up
+        self.collect_fraction = collect_fraction
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        # How long a collection takes, until we measured one
+        self.estimate_us = first_estimate_us
+
+        self.last_free = gc.mem_free()
+        self.free_after_collect = self.last_free
+        # Bytes allocated per frame, as a running average times 8
+        self.rate8 = 0
+        self.threshold = max_threshold
+        self.collections = 0
+        self.unscheduled = 0
+        self.skipped = 0
+        self.total_us = 0
+        self.last_us = 0
+        self.worst_us = 0
+        self.frames = 0
+        gc.threshold(self.threshold)
+
+    def allocation_rate(self):
+        return self.rate8 >> 3
+
+    # Called once a frame with the microseconds left before the next frame is due
+    # (zero or less when the frame ran late). Returns True if it collected.
+    @micropython.native
+    def idle(self, remaining_us):
+        self.frames += 1
+        free = gc.mem_free()
+        if free > self.last_free:
+            # The allocator collected behind our back, in the middle of a frame
+            self.unscheduled += 1
+            self.free_after_collect = free
+        else:
+            allocated = self.last_free - free
+            self.rate8 += allocated - (self.rate8 >> 3)
+        self.last_free = free
+
+        if self.free_after_collect - free < self.threshold // self.collect_fraction:
+            return False
+        if remaining_us < self.estimate_us:
+            self.skipped += 1
+            return False
+        self.collect()
+        return True
+
+    # Collects now and adjusts gc.threshold to the allocation rate
+    def collect(self):
+        started = time.ticks_us()
+        gc.collect()
+        duration = time.ticks_diff(time.ticks_us(), started)
+        self.collections += 1
+        self.total_us += duration
+        self.last_us = duration
+        if duration > self.worst_us:
+            self.worst_us = duration
+        # Lean towards the slowest recent collection, a late frame is worse than a missed chance
+        self.estimate_us = max(duration, (self.estimate_us * 3 + duration) // 4)
+
+        self.last_free = gc.mem_free()
+        self.free_after_collect = self.last_free
+        threshold = self.allocation_rate() * self.headroom_frames
+        self.threshold = min(max(threshold, self.min_threshold), self.max_threshold)
+        gc.threshold(self.threshold)
+
+    def stats(self):
+        return {
+            "collections": self.collections,
+            "unscheduled": self.unscheduled,
+            "skipped": self.skipped,
+            "total_us": self.total_us,
+            "average_us": self.total_us // self.collections if self.collections else 0,
+            "last_us": self.last_us,
+            "worst_us": self.worst_us,
+            "allocation_rate": self.allocation_rate(),
+            "threshold": self.threshold,
+            "mem_free": self.last_free,
+        }
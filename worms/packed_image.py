@@ -0,0 +1,99 @@
+# Packed images: a small header followed by one or more frames of raw pixels, stored
+# column by column like the UnicornLeds framebuffer, so a frame can be read straight
+# into a bytearray. Written by tools/convert_png_to_arrays.py.
+#
+# Header, 8 bytes:
+#   0-1  b"UL"
+#   2    pixel format, FORMAT_RGB888 (3 bytes per pixel) or FORMAT_RGB565 (2 bytes, big endian)
+#   3    version, 1
+#   4    width
+#   5    height
+#   6-7  number of frames, little endian
+MAGIC = b"UL"
+VERSION = 1
+HEADER_SIZE = 8
+FORMAT_RGB888 = 1
+FORMAT_RGB565 = 2
+
+
+def bytes_per_pixel(pixel_format):
+    return 3 if pixel_format == FORMAT_RGB888 else 2
+
+
+def pack_header(pixel_format, width, height, frames=1):
+    return MAGIC + bytes([pixel_format, VERSION, width, height, frames & 0xFF, frames >> 8])
+
+
+def read_header(header):
+    if len(header) < HEADER_SIZE or bytes(header[0:2]) != MAGIC:
+        raise ValueError("Not a packed image")
+    pixel_format = header[2]
+    if pixel_format not in (FORMAT_RGB888, FORMAT_RGB565):
+        raise ValueError(f"Unknown pixel format {pixel_format}")
+    return pixel_format, header[4], header[5], header[6] | (header[7] << 8)
+
+
+def frame_size(pixel_format, width, height):
+    return width * height * bytes_per_pixel(pixel_format)
+
+
+# Expands RGB565 pixels to RGB888, writing into a buffer of width * height * 3 bytes
+@micropython.native
+def rgb565_to_rgb888(source, destination):
+    out = 0
+    for i in range(0, len(source), 2):
+        pixel = (source[i] << 8) | source[i + 1]
+        red = (pixel >> 11) & 0x1F
+        green = (pixel >> 5) & 0x3F
+        blue = pixel & 0x1F
+        destination[out] = (red << 3) | (red >> 2)
+        destination[out + 1] = (green << 2) | (green >> 4)
+        destination[out + 2] = (blue << 3) | (blue >> 2)
+        out += 3
+
+
+# A packed image held in memory, for example a bytes literal frozen into flash. RGB888
+# frames are handed out as memoryviews on the original data, nothing is copied.
+class PackedImage:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pixel_format, self.width, self.height, self.frames = read_header(self.data)
+        self.frame_size = frame_size(self.pixel_format, self.width, self.height)
+        self.buffer = None
+
+    def frame(self, index=0):
+        start = HEADER_SIZE + index * self.frame_size
+        pixels = self.data[start:start + self.frame_size]
+        if self.pixel_format == FORMAT_RGB888:
+            return pixels
+        if self.buffer is None:
+            self.buffer = bytearray(self.width * self.height * 3)
+        rgb565_to_rgb888(pixels, self.buffer)
+        return self.buffer
+
+
+# A packed image in a file. Only one frame at a time is in memory, read into a buffer
+# that is reused for every frame.
+class PackedImageFile:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.pixel_format, self.width, self.height, self.frames = read_header(self.file.read(HEADER_SIZE))
+        self.frame_size = frame_size(self.pixel_format, self.width, self.height)
+        self.buffer = bytearray(self.width * self.height * 3)
+        self.raw = self.buffer if self.pixel_format == FORMAT_RGB888 else bytearray(self.frame_size)
+
+    def frame(self, index=0):
+        self.file.seek(HEADER_SIZE + index * self.frame_size)
+        self.file.readinto(self.raw)
+        if self.pixel_format == FORMAT_RGB565:
+            rgb565_to_rgb888(self.raw, self.buffer)
+        return self.buffer
+
+    def close(self):
+        self.file.close()
+
+
+def open_packed_image(source):
+    if isinstance(source, str):
+        return PackedImageFile(source)
+    return PackedImage(source)
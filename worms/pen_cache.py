@@ -0,0 +1,80 @@
+from array import array
+
+
+# Keeps the most recently used pens around so repeating colors (logo colors, worm colors,
+# fade steps) do not allocate a new pen every frame. Colors are keyed on packed RGB.
+#
+# Evicts with the clock (second chance) approximation of least recently used: a hit only
+# sets a bit in a bytearray, instead of reordering a dict, which costs more than it saves
+# on MicroPython. When the cache is full, the hand sweeps the slots clearing bits and
+# evicts the first pen that was not used since the hand last passed it. Size 0 turns
+# caching off but keeps counting misses.
+class PenCache:
+    def __init__(self, graphics, size=64):
+        self.graphics = graphics
+        self.size = size
+        # Packed color to slot, and per slot its color, pen and whether it was used
+        self.pens = {}
+        self.keys = array("L", [0] * size)
+        self.slot_pens = [None] * size
+        self.used = bytearray(size)
+        self.count = 0
+        self.hand = 0
+        self.hits = 0
+        self.misses = 0
+
+    @micropython.native
+    def get_pen(self, red, green, blue):
+        key = (red << 16) | (green << 8) | blue
+        slot = self.pens.get(key)
+        if slot is not None:
+            self.hits += 1
+            self.used[slot] = 1
+            return self.slot_pens[slot]
+
+        self.misses += 1
+        if self.size == 0:
+            return self.graphics.create_pen(red, green, blue)
+        if self.count < self.size:
+            slot = self.count
+            self.count += 1
+        else:
+            slot = self.evict()
+        pen = self.graphics.create_pen(red, green, blue)
+        self.pens[key] = slot
+        self.keys[slot] = key
+        self.slot_pens[slot] = pen
+        self.used[slot] = 0
+        return pen
+
+    # Frees the slot of a pen that was not used since the hand last passed it
+    @micropython.native
+    def evict(self):
+        used = self.used
+        size = self.size
+        hand = self.hand
+        while used[hand]:
+            used[hand] = 0
+            hand += 1
+            if hand == size:
+                hand = 0
+        del self.pens[self.keys[hand]]
+        self.hand = hand + 1 if hand + 1 < size else 0
+        return hand
+
+    def clear(self):
+        self.pens = {}
+        self.slot_pens = [None] * self.size
+        self.count = 0
+        self.hand = 0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self.pens)
@@ -0,0 +1,169 @@
+import _thread
+
+from array import array
+
+from worms.fastrand import rng
+
+# Stamp that stands for "fade all leds" instead of a led color
+FADE_MARKER = 0xFFFF
+
+
+# The led changes of one frame, recorded by set_led_color instead of being written to
+# the framebuffer, to be played back on the render core. Fixed size, a full buffer drops
+# further stamps and counts them in dropped. The last fade_slots stamps are kept for
+# fade markers, so the render core always fades as many times as the simulation stepped.
+class StampBuffer:
+    def __init__(self, capacity, fade_slots=1):
+        self.capacity = capacity
+        self.stamp_capacity = capacity - fade_slots
+        self.leds = array("H", bytes(2 * capacity))
+        self.colors = bytearray(3 * capacity)
+        self.adds = bytearray(capacity)
+        self.count = 0
+        self.dropped = 0
+
+    @micropython.native
+    def add(self, led, color, add):
+        count = self.count
+        if count >= self.stamp_capacity:
+            self.dropped += 1
+            return
+        self.leds[count] = led
+        index = count * 3
+        self.colors[index] = min(color[0], 255)
+        self.colors[index + 1] = min(color[1], 255)
+        self.colors[index + 2] = min(color[2], 255)
+        self.adds[count] = 1 if add else 0
+        self.count = count + 1
+
+    def add_fade(self):
+        if self.count < self.capacity:
+            self.leds[self.count] = FADE_MARKER
+            self.count += 1
+        else:
+            self.dropped += 1
+
+    # Writes the stamps into the framebuffer in the order they were made, fading the
+    # leds wherever a simulation step ended
+    @micropython.native
+    def play(self, unicorn_leds):
+        colors = unicorn_leds.colors
+        stamp_colors = self.colors
+        for i in range(self.count):
+            led = self.leds[i]
+            if led == FADE_MARKER:
+                unicorn_leds.fade_leds()
+                continue
+            index = led * 3
+            stamp = i * 3
+            if self.adds[i]:
+                colors[index] = min(colors[index] + stamp_colors[stamp], 255)
+                colors[index + 1] = min(colors[index + 1] + stamp_colors[stamp + 1], 255)
+                colors[index + 2] = min(colors[index + 2] + stamp_colors[stamp + 2], 255)
+            else:
+                colors[index] = stamp_colors[stamp]
+                colors[index + 1] = stamp_colors[stamp + 1]
+                colors[index + 2] = stamp_colors[stamp + 2]
+            unicorn_leds.mark_hot(led)
+        self.count = 0
+
+
+# Runs fading and drawing on the second core while the first core simulates the next
+# frame. The simulation records its led changes in a back buffer of stamps, once per
+# frame the buffers are swapped and the render core plays the front buffer into the
+# framebuffer, fades and pushes it to the screen.
+#
+#   pipeline = DualCorePipeline(unicorn_leds)
+#   pipeline.start()
+#   while True:
+#       life_and_death.handle_life_and_death()
+#       pipeline.end_step()
+#       pipeline.wait_idle()
+#       ...  # safe to touch the leds here, the render core is idle
+#       pipeline.submit()
+#       unicorn_leds.wait_for_loop()
+#
+# The stamp buffers hold stamps_per_step stamps for every step of a frame that catches
+# up, plus a panel full for the buttons and the profiler overlay. Pass the most led changes
+# a step can make, for the swarm two per worm. A frame that still overflows raises from
+# wait_idle instead of silently drawing something else than one core would.
+class DualCorePipeline:
+    def __init__(self, unicorn_leds, stamp_capacity=None, stamps_per_step=None):
+        max_steps = unicorn_leds.scheduler.max_steps
+        if not stamp_capacity:
+            per_step = stamps_per_step if stamps_per_step else unicorn_leds.led_count
+            stamp_capacity = max_steps * per_step + unicorn_leds.led_count
+        capacity = stamp_capacity + max_steps
+        self.unicorn_leds = unicorn_leds
+        self.back = StampBuffer(capacity, fade_slots=max_steps)
+        self.front = StampBuffer(capacity, fade_slots=max_steps)
+        # Held while there is no frame for the render core, released to hand one over
+        self.frame_ready = _thread.allocate_lock()
+        self.frame_ready.acquire()
+        # Held while the render core is busy with a frame
+        self.render_done = _thread.allocate_lock()
+        self.idle = True
+        self.running = False
+        self.error = None
+        self.frames = 0
+
+    def start(self):
+        self.running = True
+        self.unicorn_leds.stamps = self.back
+        _thread.start_new_thread(self.render_loop, ())
+
+    def stop(self):
+        self.wait_idle()
+        self.running = False
+        self.unicorn_leds.stamps = None
+        self.frame_ready.release()
+
+    # Marks the end of a simulation step, the render core fades the leds at this point
+    def end_step(self):
+        self.back.add_fade()
+
+    # Blocks until the render core is done with the last frame
+    def wait_idle(self):
+        if not self.idle:
+            self.render_done.acquire()
+            self.render_done.release()
+            self.idle = True
+        if self.error:
+            error = self.error
+            self.error = None
+            raise error
+        if self.back.dropped:
+            dropped = self.back.dropped
+            self.back.dropped = 0
+            raise RuntimeError(f"{dropped} led changes did not fit in the stamp buffer, pass a bigger stamps_per_step")
+
+    # Hands the recorded frame to the render core and starts recording the next one
+    def submit(self):
+        self.wait_idle()
+        recorder = self.unicorn_leds.recorder
+        if recorder is not None:
+            # By the time the render core records the frame, this core is simulating the next one
+            recorder.capture(rng.getstate(), self.unicorn_leds.frame_steps())
+        self.back, self.front = self.front, self.back
+        self.unicorn_leds.stamps = self.back
+        self.render_done.acquire()
+        self.idle = False
+        self.frame_ready.release()
+
+    def render_loop(self):
+        leds = self.unicorn_leds
+        while True:
+            self.frame_ready.acquire()
+            if not self.running:
+                break
+            try:
+                self.front.play(leds)
+                leds.draw_leds()
+                self.frames += 1
+            except Exception as error:
+                # Hand it to the simulation core, which raises it from wait_idle
+                self.error = error
+                self.running = False
+            self.render_done.release()
+            if not self.running:
+                break
@@ -0,0 +1,97 @@
+from worms.fastrand import ONE, next16, rng
+from worms.worms import Worm
+
+
+# Splits a probability into two 16 bit thresholds, so it can be tested with integer
+# draws only and still go down to about 1 in 4 billion
+def split_chance(probability):
+    if probability >= 1:
+        return ONE, 0
+    if probability <= 0:
+        return 0, 0
+    scaled = probability * ONE
+    high = int(scaled)
+    return high, int((scaled - high) * ONE)
+
+
+@micropython.native
+def roll(chance):
+    high, low = chance
+    draw = next16(rng.state)
+    if draw != high:
+        return draw < high
+    return next16(rng.state) < low
+
+
+# Decides when a worm is born and which kind of worm it is. The chance of a birth only
+# depends on the number of worms, and is worked out once per number of worms, so asking
+# costs the same no matter how many worms there are. Worm classes weigh in on which
+# worm is born through their BIRTH_WEIGHT.
+class BirthPolicy:
+    def __init__(self, min_worms_count=2):
+        self.min_worms_count = min_worms_count
+        self.chances = []
+        self.weights_for = None
+        self.cumulative_weights = []
+
+    def birth_chance(self, population):
+        return 1.0 if population < self.min_worms_count else 0.0
+
+    @micropython.native
+    def wants_birth(self, population):
+        chances = self.chances
+        if population >= len(chances):
+            for count in range(len(chances), population + 1):
+                chances.append(split_chance(self.birth_chance(count)))
+        return roll(chances[population])
+
+    # Picks a position in worm_collection, weighted by the BIRTH_WEIGHT of each class
+    def pick_index(self, worm_collection):
+        if self.weights_for is not worm_collection:
+            total = 0
+            self.cumulative_weights = []
+            for worm_class in worm_collection:
+                total += max(int(getattr(worm_class, "BIRTH_WEIGHT", 1)), 0)
+                self.cumulative_weights.append(total)
+            if total == 0:
+                # Nobody wants to be born, then everybody gets an equal chance
+                self.cumulative_weights = list(range(1, len(worm_collection) + 1))
+            self.weights_for = worm_collection
+        pick = rng.below(self.cumulative_weights[-1])
+        for index, weight in enumerate(self.cumulative_weights):
+            if pick < weight:
+                return index
+        return len(worm_collection) - 1
+
+    def pick_worm_class(self, worm_collection):
+        return worm_collection[self.pick_index(worm_collection)]
+
+
+# The original rule: always top up to min_worms_count, above that every extra worm
+# makes a birth birth_odds times as likely. With the default odds of one in
+# MAX_AGE + 1, the population hovers just above the minimum.
+class TargetPopulationPolicy(BirthPolicy):
+    def __init__(self, min_worms_count=2, birth_odds=None):
+        super().__init__(min_worms_count)
+        if birth_odds is None:
+            birth_odds = 1 / (Worm.MAX_AGE + 1)
+        self.birth_odds = birth_odds
+
+    def birth_chance(self, population):
+        extra = population - self.min_worms_count + 1
+        if extra <= 0:
+            return 1.0
+        return self.birth_odds ** extra
+
+
+# Logistic growth: births get rarer as the population nears capacity, and stop there
+class CarryingCapacityPolicy(BirthPolicy):
+    def __init__(self, capacity=10, birth_rate=0.01, min_worms_count=2):
+        super().__init__(min_worms_count)
+        self.capacity = capacity
+        self.birth_rate = birth_rate
+
+    def birth_chance(self, population):
+        if population < self.min_worms_count:
+            return 1.0
+        return max(self.birth_rate * (1 - population / self.capacity), 0.0)
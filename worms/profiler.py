@@ -0,0 +1,138 @@
+import gc
+import time
+
+from array import array
+
+from worms.led import Led
+
+# The stages of a frame, in the order the main loop runs them
+STAGE_BUTTONS = 0
+STAGE_LIFE = 1
+STAGE_FADE = 2
+STAGE_DRAW = 3
+STAGE_WAIT = 4
+STAGE_NAMES = ("buttons", "life", "fade", "draw", "wait")
+
+# Colors of the stages in the overlay bar. Waiting is slack, so it is not drawn.
+STAGE_COLORS = (Led.YELLOW, Led.GREEN, Led.BLUE, Led.PURPLE)
+OVERLAY_OVER_BUDGET = Led.RED
+
+
+# Keeps the timings of the last frames per stage, counts frames that took longer than
+# the frame budget and tracks how much memory every frame allocates. Read it from the
+# REPL with print_report(), or show it as a bar on the top row of the panel.
+class FrameProfiler:
+    def __init__(self, leds, history=64, overlay=False, overlay_row=0):
+        self.leds = leds
+        self.history = history
+        self.overlay = overlay
+        self.overlay_row = overlay_row
+        self.timings = [array("l", [0] * history) for _ in STAGE_NAMES]
+        self.allocated = array("l", [0] * history)
+        self.index = 0
+        self.frames = 0
+        self.missed_frames = 0
+        self.frame_start = 0
+        self.stage_start = 0
+        self.mem_start = 0
+        self.overlay_drawn = False
+
+    @micropython.native
+    def start_frame(self):
+        index = self.index
+        for timings in self.timings:
+            timings[index] = 0
+        self.overlay_drawn = False
+        self.mem_start = gc.mem_free()
+        self.frame_start = time.ticks_us()
+        self.stage_start = self.frame_start
+
+    # Closes the running stage and starts timing the next one. A stage can be marked more
+    # than once a frame, its times add up, so catch up steps can fade after every life step.
+    @micropython.native
+    def mark(self, stage):
+        now = time.ticks_us()
+        self.timings[stage][self.index] += time.ticks_diff(now, self.stage_start)
+        self.stage_start = now
+        if stage == STAGE_LIFE and self.overlay and not self.overlay_drawn:
+            # Before fading and drawing, so the bar shows up in this frame
+            self.overlay_drawn = True
+            self.draw_overlay()
+
+    # Call after the drawing stage, before waiting for the next frame
+    @micropython.native
+    def end_work(self):
+        busy = time.ticks_diff(time.ticks_us(), self.frame_start)
+        if busy > self.leds.tfps * 1000:
+            self.missed_frames += 1
+        # Negative when the garbage collector ran halfway through the frame
+        self.allocated[self.index] = self.mem_start - gc.mem_free()
+
+    @micropython.native
+    def end_frame(self):
+        self.mark(STAGE_WAIT)
+        self.frames += 1
+        self.index = (self.index + 1) % self.history
+
+    def recorded_frames(self):
+        return min(self.frames, self.history)
+
+    # Average and worst time per stage in microseconds, over the recorded frames
+    def stage_stats(self, stage):
+        count = self.recorded_frames()
+        if count == 0:
+            return 0, 0
+        timings = self.timings[stage]
+        total = 0
+        worst = 0
+        for i in range(count):
+            total += timings[i]
+            worst = max(worst, timings[i])
+        return total // count, worst
+
+    def report(self):
+        count = self.recorded_frames()
+        stages = {}
+        for stage, name in enumerate(STAGE_NAMES):
+            average, worst = self.stage_stats(stage)
+            stages[name] = {"average_us": average, "worst_us": worst}
+        allocations = [self.allocated[i] for i in range(count) if self.allocated[i] >= 0]
+        return {
+            "frames": self.frames,
+            "missed_frames": self.missed_frames,
+            "budget_us": self.leds.tfps * 1000,
+            "stages": stages,
+            "average_alloc_bytes": sum(allocations) // len(allocations) if allocations else 0,
+            "mem_free": gc.mem_free(),
+        }
+
+    def print_report(self):
+        report = self.report()
+        print(f"frames {report['frames']}, missed {report['missed_frames']}, budget {report['budget_us']}us")
+        for name, stats in report["stages"].items():
+            print(f"  {name:<8} avg {stats['average_us']:>6}us  worst {stats['worst_us']:>6}us")
+        print(f"  allocated {report['average_alloc_bytes']} bytes/frame, {report['mem_free']} bytes free")
+
+    def reset(self):
+        self.index = 0
+        self.frames = 0
+        self.missed_frames = 0
+
+    # Draws the work done in the previous frame as a bar over the top row, one segment per
+    # stage, scaled so the full width is the frame budget. Red when over budget.
+    def draw_overlay(self):
+        leds = self.leds
+        width = leds.uni_width
+        budget = leds.tfps * 1000
+        previous = (self.index - 1) % self.history
+        busy = 0
+        for stage in range(STAGE_WAIT):
+            busy += self.timings[stage][previous]
+
+        x = 0
+        for stage in range(STAGE_WAIT):
+            end = min(width, x + (self.timings[stage][previous] * width) // budget)
+            color = OVERLAY_OVER_BUDGET if busy > budget else STAGE_COLORS[stage]
+            while x < end:
+                leds.set_led_color(x, self.overlay_row, color, ignore_add=True)
+                x += 1
@@ -0,0 +1,269 @@
+from worms.fastrand import rng
+
+# A recording is a small header and then one record per frame or button press:
+#
+#   header    b"UR", version, 0, width (u16), height (u16), rng state at the start (u32)
+#   keyframe  KEYFRAME, rng state (u32), steps (u8), width * height * 3 bytes
+#   frame     FRAME, rng state (u32), steps (u8), run count (u16), runs
+#   run       first led (u16), length (u8), length * 3 bytes
+#   button    BUTTON, button (u8), pressed before the next frame record
+#
+# Numbers are little endian, leds are numbered like the UnicornLeds framebuffer
+# (x * height + y) and colors are what was sent to the panel, after the output tables.
+# The rng state is the one after the frame was simulated, steps how many simulation
+# steps the frame ran.
+MAGIC = b"UR"
+VERSION = 1
+HEADER_SIZE = 12
+
+KEYFRAME = 1
+FRAME = 2
+BUTTON = 3
+
+MAX_RUN = 255
+
+
+def put_u16(buffer, offset, value):
+    buffer[offset] = value & 0xFF
+    buffer[offset + 1] = (value >> 8) & 0xFF
+
+
+def put_u32(buffer, offset, value):
+    buffer[offset] = value & 0xFF
+    buffer[offset + 1] = (value >> 8) & 0xFF
+    buffer[offset + 2] = (value >> 16) & 0xFF
+    buffer[offset + 3] = (value >> 24) & 0xFF
+
+
+def get_u16(buffer, offset):
+    return buffer[offset] | (buffer[offset + 1] << 8)
+
+
+def get_u32(buffer, offset):
+    return buffer[offset] | (buffer[offset + 1] << 8) | (buffer[offset + 2] << 16) | (buffer[offset + 3] << 24)
+
+
+# Records what the panel shows, frame by frame, plus everything needed to replay the
+# run: the rng state and the button presses. Records go into a preallocated buffer that
+# is written to the file when full and every flush_frames frames, so recording a frame
+# only costs looking at the leds that were drawn.
+#
+# Make it before anything draws from the rng, then hook it up:
+#
+#   recorder = Recorder("run.bin")
+#   UnicornLeds.recorder = recorder
+#   ButtonPresses.recorder = recorder
+class Recorder:
+    def __init__(self, path, buffer_size=4096, keyframe_frames=0, flush_frames=300):
+        self.file = open(path, "wb")
+        self.buffer = bytearray(buffer_size)
+        self.used = 0
+        # A keyframe every this many frames, 0 for only the first frame
+        self.keyframe_frames = keyframe_frames
+        self.flush_frames = flush_frames
+        self.start_state = rng.getstate()
+        self.frames = 0
+        self.flushes = 0
+        # What the panel shows, filled in on the first frame
+        self.shown = None
+        self.changed = None
+        # Set by capture when frames are drawn on another core than they are simulated on
+        self.captured_state = -1
+        self.captured_steps = 0
+        # What went into the last frame record
+        self.last_state = 0
+        self.last_steps = 0
+
+    def start(self, leds):
+        self.shown = bytearray(leds.led_count * 3)
+        self.changed = bytearray(leds.led_count)
+        # A frame where every led changed has to fit
+        if len(self.buffer) < 8 + leds.led_count * 6:
+            self.buffer = bytearray(8 + leds.led_count * 6)
+        header = bytearray(HEADER_SIZE)
+        header[0:2] = MAGIC
+        header[2] = VERSION
+        put_u16(header, 4, leds.uni_width)
+        put_u16(header, 6, leds.uni_height)
+        put_u32(header, 8, self.start_state)
+        self.file.write(header)
+
+    # Makes room for size more bytes in the buffer
+    def reserve(self, size):
+        if self.used + size > len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        if self.used:
+            self.file.write(memoryview(self.buffer)[: self.used])
+            self.used = 0
+        self.file.flush()
+        self.flushes += 1
+
+    def close(self):
+        if self.file:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def record_button(self, button):
+        self.reserve(2)
+        self.buffer[self.used] = BUTTON
+        self.buffer[self.used + 1] = button
+        self.used += 2
+
+    # The rng state and steps of the frame about to be drawn, for when it is drawn on
+    # the render core while the simulation core already moves on, see DualCorePipeline
+    def capture(self, rng_state, steps):
+        self.captured_state = rng_state
+        self.captured_steps = steps
+
+    # Called by UnicornLeds.draw_leds with the queued leds, before they are pushed
+    @micropython.native
+    def record_frame(self, leds):
+        if self.shown is None:
+            self.start(leds)
+        shown = self.shown
+        changed = self.changed
+        colors = leds.colors
+        red = leds.tables.red
+        green = leds.tables.green
+        blue = leds.tables.blue
+        draw_queue = leds.draw_queue
+        first = leds.led_count
+        last = -1
+        for i in range(leds.draw_count):
+            led = draw_queue[i]
+            index = led * 3
+            r = red[colors[index]]
+            g = green[colors[index + 1]]
+            b = blue[colors[index + 2]]
+            if shown[index] != r or shown[index + 1] != g or shown[index + 2] != b:
+                shown[index] = r
+                shown[index + 1] = g
+                shown[index + 2] = b
+                changed[led] = 1
+                if led < first:
+                    first = led
+                if led > last:
+                    last = led
+
+        if self.captured_state >= 0:
+            rng_state = self.captured_state
+            steps = self.captured_steps
+            self.captured_state = -1
+        else:
+            rng_state = rng.getstate()
+            steps = leds.scheduler.steps
+        self.last_state = rng_state
+        self.last_steps = steps
+        if self.frames == 0 or (self.keyframe_frames and self.frames % self.keyframe_frames == 0):
+            for led in range(first, last + 1):
+                changed[led] = 0
+            self.write_keyframe(rng_state, steps)
+        else:
+            self.write_frame(rng_state, steps, first, last)
+
+        self.frames += 1
+        if self.flush_frames and self.frames % self.flush_frames == 0:
+            self.flush()
+
+    def write_keyframe(self, rng_state, steps):
+        self.reserve(6)
+        buffer = self.buffer
+        buffer[self.used] = KEYFRAME
+        put_u32(buffer, self.used + 1, rng_state)
+        buffer[self.used + 5] = steps
+        self.used += 6
+        # Keyframes can be bigger than the whole buffer
+        self.flush()
+        self.file.write(self.shown)
+
+    # Writes the changed leds between first and last as runs of neighbouring leds
+    @micropython.native
+    def write_frame(self, rng_state, steps, first, last):
+        # Worst case every led between first and last is a run of its own
+        self.reserve(8 + max(last - first + 1, 0) * 6)
+        buffer = self.buffer
+        shown = self.shown
+        changed = self.changed
+        used = self.used
+        buffer[used] = FRAME
+        put_u32(buffer, used + 1, rng_state)
+        buffer[used + 5] = steps
+        count_at = used + 6
+        used += 8
+        runs = 0
+        led = first
+        while led <= last:
+            if not changed[led]:
+                led += 1
+                continue
+            put_u16(buffer, used, led)
+            length_at = used + 2
+            used += 3
+            length = 0
+            while led <= last and changed[led] and length < MAX_RUN:
+                changed[led] = 0
+                index = led * 3
+                buffer[used] = shown[index]
+                buffer[used + 1] = shown[index + 1]
+                buffer[used + 2] = shown[index + 2]
+                used += 3
+                length += 1
+                led += 1
+            buffer[length_at] = length
+            runs += 1
+        put_u16(buffer, count_at, runs)
+        self.used = used
+
+
+# Reads a recording back. frames() yields every frame as
+# (frame number, pixels, rng state, steps, buttons pressed before it), with pixels the
+# whole panel as it was shown. The same pixels buffer is reused for every frame.
+class RecordingReader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        if bytes(self.data[0:2]) != MAGIC or self.data[2] != VERSION:
+            raise ValueError("not a worms recording")
+        self.width = get_u16(self.data, 4)
+        self.height = get_u16(self.data, 6)
+        self.start_state = get_u32(self.data, 8)
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as file:
+            return cls(file.read())
+
+    def frames(self):
+        data = self.data
+        pixels = bytearray(self.width * self.height * 3)
+        offset = HEADER_SIZE
+        frame = 0
+        buttons = []
+        while offset < len(data):
+            tag = data[offset]
+            if tag == BUTTON:
+                buttons.append(data[offset + 1])
+                offset += 2
+                continue
+            state = get_u32(data, offset + 1)
+            steps = data[offset + 5]
+            if tag == KEYFRAME:
+                offset += 6
+                pixels[:] = data[offset : offset + len(pixels)]
+                offset += len(pixels)
+            elif tag == FRAME:
+                runs = get_u16(data, offset + 6)
+                offset += 8
+                for _ in range(runs):
+                    index = get_u16(data, offset) * 3
+                    size = data[offset + 2] * 3
+                    offset += 3
+                    pixels[index : index + size] = data[offset : offset + size]
+                    offset += size
+            else:
+                raise ValueError(f"unknown record {tag} at {offset}")
+            yield frame, pixels, state, steps, buttons
+            frame += 1
+            buttons = []
@@ -0,0 +1,91 @@
+# Buckets worms per block of cells, so worms looking for their neighbours only have to
+# look at the blocks around them instead of at every worm on the panel.
+class SpatialGrid:
+    def __init__(self, width, height, cell_size=4):
+        self.cell_size = cell_size
+        self.columns = (width + cell_size - 1) // cell_size
+        self.rows = (height + cell_size - 1) // cell_size
+        self.cells = [[] for _ in range(self.columns * self.rows)]
+
+    @micropython.native
+    def cell_of(self, x, y):
+        column = min(max(x // self.cell_size, 0), self.columns - 1)
+        row = min(max(y // self.cell_size, 0), self.rows - 1)
+        return row * self.columns + column
+
+    def add(self, worm):
+        worm.grid_cell = self.cell_of(worm.x, worm.y)
+        self.cells[worm.grid_cell].append(worm)
+
+    def remove(self, worm):
+        if worm.grid_cell >= 0:
+            self.cells[worm.grid_cell].remove(worm)
+            worm.grid_cell = -1
+
+    # Call after a worm moved, moves it to another bucket if it crossed into one
+    @micropython.native
+    def update(self, worm):
+        cell = self.cell_of(worm.x, worm.y)
+        if cell != worm.grid_cell:
+            if worm.grid_cell >= 0:
+                self.cells[worm.grid_cell].remove(worm)
+            self.cells[cell].append(worm)
+            worm.grid_cell = cell
+
+    def clear(self):
+        for cell in self.cells:
+            cell.clear()
+
+    # Finds the worm closest to x, y (counting steps, not as the crow flies). Searches
+    # rings of blocks around x, y and stops as soon as no worm further out can be closer.
+    @micropython.native
+    def nearest(self, x, y, exclude=None, max_distance=-1):
+        closest_worm = None
+        closest_distance = -1
+        cell_size = self.cell_size
+        columns = self.columns
+        rows = self.rows
+        center_column = min(max(x // cell_size, 0), columns - 1)
+        center_row = min(max(y // cell_size, 0), rows - 1)
+        for ring in range(max(columns, rows)):
+            # Worms in this ring are at least this far away
+            ring_distance = (ring - 1) * cell_size + 1 if ring > 0 else 0
+            if closest_worm is not None and closest_distance < ring_distance:
+                break
+            if 0 <= max_distance < ring_distance:
+                break
+            for row in range(center_row - ring, center_row + ring + 1):
+                if row < 0 or row >= rows:
+                    continue
+                on_edge_row = row == center_row - ring or row == center_row + ring
+                # Inside the ring only the first and last column belong to it
+                step = 1 if on_edge_row else 2 * ring
+                column = center_column - ring
+                while column <= center_column + ring:
+                    if 0 <= column < columns:
+                        for worm in self.cells[row * columns + column]:
+                            if worm is exclude:
+                                continue
+                            distance = abs(worm.x - x) + abs(worm.y - y)
+                            if 0 <= max_distance < distance:
+                                continue
+                            if closest_worm is None or distance < closest_distance:
+                                closest_worm = worm
+                                closest_distance = distance
+                    column += step
+        return closest_worm
+
+    # All worms within radius steps of x, y
+    def within(self, x, y, radius, exclude=None):
+        found = []
+        cell_size = self.cell_size
+        first_column = max((x - radius) // cell_size, 0)
+        last_column = min((x + radius) // cell_size, self.columns - 1)
+        first_row = max((y - radius) // cell_size, 0)
+        last_row = min((y + radius) // cell_size, self.rows - 1)
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                for worm in self.cells[row * self.columns + column]:
+                    if worm is not exclude and abs(worm.x - x) + abs(worm.y - y) <= radius:
+                        found.append(worm)
+        return found
@@ -0,0 +1,110 @@
+from array import array
+
+
+# The leds a worm covers, head first, in a ring buffer that is allocated once. Moving
+# the worm writes the new head over the slot of the tail it drops.
+class WormBody:
+    def __init__(self, length):
+        self.length = length
+        self.cells = array("H", [0] * length)
+        self.head = -1
+        self.size = 0
+
+    def head_cell(self):
+        return self.cells[self.head] if self.size else -1
+
+    # Adds a new head, returns the tail cell that fell off or -1
+    @micropython.native
+    def push(self, led):
+        head = self.head + 1
+        if head == self.length:
+            head = 0
+        self.head = head
+        dropped = -1
+        if self.size == self.length:
+            dropped = self.cells[head]
+        else:
+            self.size += 1
+        self.cells[head] = led
+        return dropped
+
+    # The cell the next push drops, or -1 while the body is still growing
+    def tail_cell(self):
+        if self.size < self.length:
+            return -1
+        return self.cells[(self.head + 1) % self.length]
+
+    @micropython.native
+    def covers(self, led):
+        cells = self.cells
+        for i in range(self.size):
+            if cells[i] == led:
+                return True
+        return False
+
+    # Oldest cell first
+    def tail_cells(self):
+        start = self.head - self.size + 1
+        for i in range(self.size):
+            yield self.cells[(start + i) % self.length]
+
+
+# Trail mode: worms have a body of a fixed number of leds instead of leaving a fading
+# trail. Only the new head and the dropped tail are drawn when a worm moves, nothing
+# fades, so drawing costs as much as the worms move instead of the size of the panel.
+# occupancy counts the worm cells on every led, so worms can see where the others are.
+#
+# Body cells are painted with UnicornLeds.paint, so they are never faded, not even when
+# a brightness or background change makes every led hot. Painting writes the
+# framebuffer straight away, so this does not mix with DualCorePipeline.
+class Trails:
+    def __init__(self, leds, length=8):
+        self.leds = leds
+        self.length = length
+        self.occupancy = bytearray(leds.led_count)
+
+    def make_body(self):
+        return WormBody(self.length)
+
+    @micropython.native
+    def is_occupied(self, led):
+        return self.occupancy[led] != 0
+
+    # Whether a worm with this body can not move onto led. Its own tail is no obstacle,
+    # it moves out of the way in the same step.
+    @micropython.native
+    def is_blocked(self, body, led):
+        count = self.occupancy[led]
+        if count == 1 and led == body.tail_cell():
+            return False
+        return count != 0
+
+    # Moves the body onto led and paints it, or only repaints the head when the worm
+    # did not move
+    @micropython.native
+    def advance(self, body, led, color):
+        leds = self.leds
+        if body.head_cell() != led:
+            occupancy = self.occupancy
+            if occupancy[led] < 255:
+                occupancy[led] += 1
+            dropped = body.push(led)
+            if dropped >= 0:
+                self.release(dropped)
+        leds.paint(led, color)
+
+    # Takes one worm cell off a led, the led goes back to its background when no worm is left on it
+    @micropython.native
+    def release(self, led):
+        occupancy = self.occupancy
+        if occupancy[led] > 0:
+            occupancy[led] -= 1
+        if occupancy[led] == 0:
+            self.leds.restore(led)
+
+    # Takes the whole body off the panel, when the worm dies
+    def clear(self, body):
+        for led in body.tail_cells():
+            self.release(led)
+        body.head = -1
+        body.size = 0
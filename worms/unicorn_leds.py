@@ -1,34 +1,198 @@
 import builtins
-import time
 
-from worms.led import Led
+from array import array
+
+from worms.board_geometry import BoardGeometry
+from worms.color_tables import ColorTables
+from worms.frame_scheduler import FrameScheduler
+from worms.kernels import DEFAULT_CHOICE, get_kernel
 from worms.logos import vopak_logo
+from worms.packed_image import PackedImageFile, open_packed_image
+from worms.pen_cache import PenCache
+
+
+# Thin compatibility view on a single pixel in the framebuffer. Reading .color returns
+# a fresh list, assigning to .color writes straight into the framebuffer.
+class LedView:
+    def __init__(self, leds, x, y):
+        self.leds = leds
+        self.x = x
+        self.y = y
+
+    @property
+    def color(self):
+        index = self.leds.led_index(self.x, self.y)
+        colors = self.leds.colors
+        return [colors[index], colors[index + 1], colors[index + 2]]
+
+    @color.setter
+    def color(self, color):
+        self.leds.set_led_color(self.x, self.y, color, ignore_add=True)
+
+
+class LedColumnView:
+    def __init__(self, leds, x):
+        self.leds = leds
+        self.x = x
+
+    def __len__(self):
+        return self.leds.uni_height
+
+    def __getitem__(self, y):
+        if y < 0:
+            y += self.leds.uni_height
+        if not 0 <= y < self.leds.uni_height:
+            raise IndexError("led y out of range")
+        return LedView(self.leds, self.x, y)
+
+
+# Lets old code keep using leds_map[x][y].color without the framebuffer having to
+# keep a Led object around for every pixel
+class LedsMapView:
+    def __init__(self, leds):
+        self.leds = leds
+
+    def __len__(self):
+        return self.leds.uni_width
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.leds.uni_width
+        if not 0 <= x < self.leds.uni_width:
+            raise IndexError("led x out of range")
+        return LedColumnView(self.leds, x)
+
 
 class UnicornLeds:
-    def __init__(self, graphics, stellar, fps=60, min_brightness=0.1, start_brightness=0.5):
-        self.pen_map = {}
+    # Set to a Recorder to record every frame that is drawn, see worms/recorder.py
+    recorder = None
+
+    def __init__(
+        self,
+        graphics,
+        stellar,
+        fps=60,
+        min_brightness=0.1,
+        start_brightness=0.5,
+        pen_cache_size=64,
+        adaptive_frames=False,
+        background=vopak_logo,
+        color_tables=None,
+        software_brightness=False,
+    ):
         self.graphics = graphics
+        self.pen_map = PenCache(graphics, size=pen_cache_size)
         self.stellar = stellar
         self.fps = fps  # Lower is slower
         self.tfps = 1000 // fps
         self.max_fps = 200
         self.uni_width, self.uni_height = graphics.get_bounds()
-        self.leds = []
-        self.leds_map = []
+        self.geometry = BoardGeometry(self.uni_width, self.uni_height)
         self.deteriorate_speed = 10  # Lower is slower
         self.led_color_add = True
         self.brightness = start_brightness
         self.min_brightness = min_brightness
-        self.stellar.set_brightness(self.brightness)
-        self.last_update = time.ticks_ms()
+        # With software brightness the panel runs at full brightness and the output
+        # tables scale the colors instead, see worms/color_tables.py
+        self.software_brightness = software_brightness
+        self.tables = color_tables if color_tables else ColorTables()
+        self.tables.build_fade(self.deteriorate_speed)
+        self.scheduler = FrameScheduler(fps, adaptive=adaptive_frames)
+
+        # The framebuffer: three bytes per led, column by column, so led (x, y) starts
+        # at (x * uni_height + y) * 3. The background is the floor colors fade down to.
+        self.led_count = self.uni_width * self.uni_height
+        self.colors = bytearray(self.led_count * 3)
+        self.background = bytearray(self.led_count * 3)
+        self.leds_map = LedsMapView(self)
+
+        # Hot leds sit above their background and still need fading. Only those are
+        # faded every frame, and only the leds that changed get pushed to the screen.
+        # Per led, bit 1 says it is in hot_leds and bit 2 that it is already in draw_queue.
+        # Bit 4 marks a led painted in trail mode: it is drawn but never faded.
+        self.hot = bytearray(self.led_count)
+        self.hot_leds = array("H", bytes(2 * self.led_count))
+        self.hot_count = 0
+        self.draw_queue = array("H", bytes(2 * self.led_count))
+        self.draw_count = 0
+
+        self.load_background(background)
+        self.colors[:] = self.background
+        self.mark_all_dirty()
+        self.apply_brightness()
+
+        # Set by DualCorePipeline: set_led_color then records the change for the
+        # render core instead of writing it, see worms/pipeline.py
+        self.stamps = None
+
+        # The fade, blend and push loops, see worms/kernels.py
+        self.use_kernels(DEFAULT_CHOICE)
 
-        for x in range(self.uni_width):
-            row = []
-            for y in range(self.uni_height):
-                led = Led(x, y, vopak_logo[x][y])
-                self.leds.append(led)
-                row.append(led)
-            self.leds_map.append(row)
+    # Loads the first frame of a packed image (see worms/packed_image.py) as the
+    # background, either from a bytes object or from a .bin file on flash
+    def load_background(self, source, x_offset=0, y_offset=0):
+        image = open_packed_image(source)
+        self.set_background(image.frame(0), image.width, image.height, x_offset, y_offset)
+        if isinstance(image, PackedImageFile):
+            image.close()
+
+    # Copies packed RGB888 pixels, column by column, into the background with the top
+    # left corner at x_offset, y_offset. Whatever falls outside the panel is cut off, the
+    # rest of the panel keeps its background. Leds whose background changed are made
+    # hot, so they fade to their new floor.
+    @micropython.native
+    def set_background(self, pixels, width, height, x_offset=0, y_offset=0):
+        background = self.background
+        panel_height = self.uni_height
+        first_row = max(0, -y_offset)
+        last_row = min(height, panel_height - y_offset)
+        for x in range(max(0, -x_offset), min(width, self.uni_width - x_offset)):
+            source = (x * height + first_row) * 3
+            led = (x + x_offset) * panel_height + first_row + y_offset
+            index = led * 3
+            for _ in range(first_row, last_row):
+                red = pixels[source]
+                green = pixels[source + 1]
+                blue = pixels[source + 2]
+                if background[index] != red or background[index + 1] != green or background[index + 2] != blue:
+                    background[index] = red
+                    background[index + 1] = green
+                    background[index + 2] = blue
+                    self.mark_hot(led)
+                source += 3
+                index += 3
+                led += 1
+
+    # Switches to the given variant of every kernel, like the choice kernels.calibrate makes
+    def use_kernels(self, choice):
+        self.kernel_choice = choice
+        self.fade_kernel = get_kernel("fade", choice["fade"])
+        self.blend_kernel = get_kernel("blend", choice["blend"])
+        self.push_kernel = get_kernel("push", choice["push"])
+
+    def led_index(self, x, y):
+        return (x * self.uni_height + y) * 3
+
+    # Makes every led hot, so the next update redraws the whole panel once
+    def mark_all_dirty(self):
+        hot = self.hot
+        hot_leds = self.hot_leds
+        for led in range(self.led_count):
+            hot[led] |= 1
+            hot_leds[led] = led
+        self.hot_count = self.led_count
+
+    @micropython.native
+    def mark_hot(self, led):
+        if not self.hot[led] & 1:
+            self.hot[led] |= 1
+            self.hot_leds[self.hot_count] = led
+            self.hot_count += 1
+
+    # Changes how much leds fade every step, lower is slower
+    def set_fade_speed(self, speed):
+        self.deteriorate_speed = speed
+        self.tables.build_fade(speed)
 
     # Changes the speed of handling updates, in effect changing the speed with which worms move
     def change_speed(self, adjustment):
@@ -37,43 +201,92 @@ class UnicornLeds:
         elif self.fps + adjustment < self.max_fps:
             self.fps += adjustment
         self.tfps = 1000 // self.fps
+        self.scheduler.set_fps(self.fps)
 
     @micropython.native
     def set_led_color(self, x, y, color, ignore_add=False):
+        if not (0 <= x < self.uni_width and 0 <= y < self.uni_height):
+            raise IndexError("led out of range")
+        led = x * self.uni_height + y
+        if self.stamps is not None:
+            self.stamps.add(led, color, self.led_color_add and not ignore_add)
+            return
+        colors = self.colors
+        index = led * 3
         if self.led_color_add and not ignore_add:
-            led = self.leds_map[x][y]
-            new_color = []
-            for i in range(3):
-                added = led.color[i] + color[i]
-                new_color.append(min(added, 255))
-            self.leds_map[x][y].color = new_color
+            self.blend_kernel(colors, index, color)
         else:
-            self.leds_map[x][y].color = color
+            colors[index] = color[0]
+            colors[index + 1] = color[1]
+            colors[index + 2] = color[2]
+        self.mark_hot(led)
+
+    # Writes a color that is never faded, so it stays until painted over or restored,
+    # even when the led is made hot again. Used by trail mode, see worms/trails.py.
+    @micropython.native
+    def paint(self, led, color):
+        index = led * 3
+        colors = self.colors
+        colors[index] = color[0]
+        colors[index + 1] = color[1]
+        colors[index + 2] = color[2]
+        self.hot[led] |= 4
+        self.queue_draw(led)
+
+    # Puts the background back on a painted led
+    @micropython.native
+    def restore(self, led):
+        index = led * 3
+        colors = self.colors
+        background = self.background
+        colors[index] = background[index]
+        colors[index + 1] = background[index + 1]
+        colors[index + 2] = background[index + 2]
+        self.hot[led] &= 3
+        self.queue_draw(led)
+
+    @micropython.native
+    def queue_draw(self, led):
+        if not self.hot[led] & 2:
+            self.hot[led] |= 2
+            self.draw_queue[self.draw_count] = led
+            self.draw_count += 1
 
-    # Slower with viper
     def update_leds(self):
-        for led in self.leds:
-            # Update the color in the LED object
-            led.color[0] = max(led.color[0] - self.deteriorate_speed, vopak_logo[led.x][led.y][0])
-            led.color[1] = max(led.color[1] - self.deteriorate_speed, vopak_logo[led.x][led.y][1])
-            led.color[2] = max(led.color[2] - self.deteriorate_speed, vopak_logo[led.x][led.y][2])
-
-            # Update the color on the screen
-            self.graphics.set_pen(self.graphics.create_pen(*led.color))
-            self.graphics.pixel(led.x, led.y)
+        self.fade_leds()
+        self.draw_leds()
+
+    # Fades the hot leds towards their background and queues them for drawing. Leds
+    # that reach the background are drawn one last time and then dropped from the hot list.
+    # Can run several times before a draw_leds, every led is queued only once.
+    def fade_leds(self):
+        counts = self.fade_kernel(self, self.tables.fade)
+        self.hot_count = counts >> 16
+        self.draw_count = counts & 0xFFFF
+
+    # Pushes the queued leds to the screen
+    def draw_leds(self):
+        if self.recorder is not None:
+            self.recorder.record_frame(self)
+        self.push_kernel(self)
+        self.draw_count = 0
         self.stellar.update(self.graphics)
 
     def black_out(self):
-        for led in self.leds:
-            led.color = (0, 0, 0)
-            self.update_leds()
+        colors = self.colors
+        for index in range(len(colors)):
+            colors[index] = 0
+        self.mark_all_dirty()
+        self.update_leds()
 
     def wait_for_loop(self):
         # Wait for the next frame
-        diff = time.ticks_diff(self.last_update, time.ticks_ms())
-        if diff < self.tfps:
-            time.sleep_ms(self.tfps - diff)
-        self.last_update = time.ticks_ms()
+        self.scheduler.wait()
+
+    # How many simulation steps the coming frame should run, more than one when
+    # adaptive frames are on and the last frame ran late
+    def frame_steps(self):
+        return self.scheduler.steps
 
     def change_brightness(self, param):
         self.brightness += param
@@ -81,4 +294,14 @@ class UnicornLeds:
             self.brightness = 1.0
         elif self.brightness <= self.min_brightness:
             self.brightness = self.min_brightness
-        self.stellar.set_brightness(self.brightness)
+        self.apply_brightness()
+
+    def apply_brightness(self):
+        if self.software_brightness:
+            self.stellar.set_brightness(1.0)
+            if self.tables.build_output(self.brightness):
+                # Every led looks different now, not just the hot ones
+                self.mark_all_dirty()
+        else:
+            self.stellar.set_brightness(self.brightness)
+            self.tables.build_output(1.0)
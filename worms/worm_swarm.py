@@ -0,0 +1,361 @@
+from array import array
+
+from worms.board_geometry import HEADING_EDGES, TURN_X, TURN_Y
+from worms.fastrand import HALF, next16, rng, threshold
+from worms.population import TargetPopulationPolicy
+from worms.worms import Worm, SlowWorm, RedHeadWorm, RainbowWorm, ChasingWorm, ScaredWorm
+
+# Behaviour flags of a worm kind
+KIND_SLOW = 1  # Only moves every other frame
+KIND_FIXED_TURN = 2  # Always turns up or right
+KIND_BODY = 4  # Leaves a body colored led behind its head
+KIND_CHASE = 8  # Heads for the closest worm
+KIND_FLEE = 16  # Runs from the closest worm
+
+# Side of the square blocks worms are bucketed in to find the closest one
+GRID_CELL_SIZE = 4
+
+
+# What the swarm needs to know about a worm class. The worm classes stay the description
+# of how a worm behaves: a prototype of each is made once and its settings are read out.
+class WormKind:
+    def __init__(self, worm_class, leds):
+        prototype = worm_class(leds)
+        self.worm_class = worm_class
+        self.turn_threshold = threshold(prototype.turn_chance)
+        self.edge_turn_threshold = threshold(getattr(prototype, "small_turn_chance", prototype.turn_chance))
+        self.flags = 0
+        if isinstance(prototype, SlowWorm):
+            self.flags |= KIND_SLOW
+        if worm_class.decide_up_or_down is not Worm.decide_up_or_down:
+            self.flags |= KIND_FIXED_TURN
+        self.body_color = None
+        if isinstance(prototype, RedHeadWorm):
+            self.flags |= KIND_BODY
+            self.body_color = prototype.worm_body_color
+        self.scare_factor = 0
+        if isinstance(prototype, ChasingWorm):
+            self.flags |= KIND_CHASE
+        if isinstance(prototype, ScaredWorm):
+            self.flags |= KIND_FLEE
+            self.scare_factor = prototype.scare_factor
+
+        # The colors the worm cycles through, one per frame
+        if isinstance(prototype, RainbowWorm):
+            colors = RainbowWorm.DIMMED_RAINBOW_COLORS
+        elif hasattr(prototype, "worm_second_color"):
+            colors = [prototype.worm_second_color, prototype.worm_color]
+        else:
+            colors = [prototype.worm_color]
+        self.color_tables = []
+        for color in colors:
+            table = Worm.age_color_tables.get(color)
+            self.color_tables.append(table if table else Worm.build_age_color_table(color))
+
+
+# All worms in parallel arrays instead of one object per worm, stepped in a single pass
+# per frame. Has the same interface as LifeAndDeath, so it can take its place in the
+# main loop. Meant for hundreds of worms on the Pico, or thousands on the host.
+class WormSwarm:
+    def __init__(self, worm_collection, unicorn_leds, min_worms_count=2, max_worms=256, height_adjust=1, policy=None):
+        self.unicorn_leds = unicorn_leds
+        self.min_worms_count = min_worms_count
+        self.policy = policy if policy else TargetPopulationPolicy(min_worms_count)
+        self.worm_collection = worm_collection
+        self.max_worms = max_worms
+        self.height_adjust = height_adjust
+        self.kinds = [WormKind(worm_class, unicorn_leds) for worm_class in worm_collection]
+
+        self.count = 0
+        self.x = array("h", bytes(2 * max_worms))
+        self.y = array("h", bytes(2 * max_worms))
+        self.x_speed = array("b", bytes(max_worms))
+        self.y_speed = array("b", bytes(max_worms))
+        self.age = array("H", bytes(2 * max_worms))
+        self.wait_move = array("B", bytes(max_worms))
+        self.kind = array("B", bytes(max_worms))
+        # Slow worms sit out the frame after they moved
+        self.resting = bytearray(max_worms)
+        # Removing a worm moves the last one into its slot, so the slots are not in
+        # birth order. The number of its birth per worm finds the youngest.
+        self.birth = array("L", [0] * max_worms)
+        self.births = 0
+
+        # Chasing and scared worms look for the closest worm in blocks of the panel: the
+        # first worm of every block, and per worm the next one in its block, -1 ends a list
+        width = unicorn_leds.uni_width
+        height = unicorn_leds.uni_height
+        self.grid_columns = (width + GRID_CELL_SIZE - 1) // GRID_CELL_SIZE
+        self.grid_rows = (height + GRID_CELL_SIZE - 1) // GRID_CELL_SIZE
+        self.grid_first = array("h", [-1] * (self.grid_columns * self.grid_rows))
+        self.grid_next = array("h", [-1] * max_worms)
+        self.seekers = any(kind.flags & (KIND_CHASE | KIND_FLEE) for kind in self.kinds)
+
+    # Keeps LifeAndDeath users happy, the swarm has no worm objects
+    @property
+    def worms(self):
+        return range(self.count)
+
+    def add_worm(self, kind_index=None):
+        if self.count >= self.max_worms:
+            return -1
+        if kind_index is None:
+            kind_index = self.policy.pick_index(self.worm_collection)
+        leds = self.unicorn_leds
+        i = self.count
+        self.x[i] = rng.randint(0, leds.uni_width - 2)
+        self.y[i] = rng.randint(self.height_adjust, leds.uni_height - 1)
+        self.x_speed[i] = Worm.DEFAULT_SPEED
+        self.y_speed[i] = 0
+        self.age[i] = 0
+        self.wait_move[i] = 0
+        self.kind[i] = kind_index
+        self.resting[i] = 0
+        self.births += 1
+        self.birth[i] = self.births
+        self.count += 1
+        return i
+
+    # Moves the last worm into slot i
+    def remove_worm(self, i):
+        last = self.count - 1
+        if i != last:
+            self.x[i] = self.x[last]
+            self.y[i] = self.y[last]
+            self.x_speed[i] = self.x_speed[last]
+            self.y_speed[i] = self.y_speed[last]
+            self.age[i] = self.age[last]
+            self.wait_move[i] = self.wait_move[last]
+            self.kind[i] = self.kind[last]
+            self.resting[i] = self.resting[last]
+            self.birth[i] = self.birth[last]
+        self.count = last
+
+    def handle_life_and_death(self):
+        self.step()
+        if self.seekers:
+            self.seek()
+        self.procreate()
+
+    # Moves, ages and draws every worm. Follows Worm.move: wait when dying, move, turn
+    # when ramming an edge or when feeling like it, then draw the head.
+    @micropython.native
+    def step(self):
+        leds = self.unicorn_leds
+        height = leds.uni_height
+        edges = leds.geometry.edge_mask(self.height_adjust)
+        kinds = self.kinds
+        xs = self.x
+        ys = self.y
+        x_speeds = self.x_speed
+        y_speeds = self.y_speed
+        ages = self.age
+        wait_moves = self.wait_move
+        worm_kinds = self.kind
+        max_age = Worm.MAX_AGE
+        dying_boundary = Worm.DYING_BOUNDARY
+        age_slowdown = Worm.AGE_SLOWDOWN
+        color_steps = Worm.AGE_COLOR_STEPS
+        state = rng.state
+        resting = self.resting
+
+        i = 0
+        while i < self.count:
+            kind = kinds[worm_kinds[i]]
+            flags = kind.flags
+            age = ages[i]
+            x = xs[i]
+            y = ys[i]
+            life_left = max_age - age
+            moved = True
+
+            if flags & KIND_SLOW and resting[i]:
+                # Like SlowWorm: only the head is drawn and the worm does not age
+                resting[i] = 0
+                moved = False
+            else:
+                if flags & KIND_SLOW:
+                    resting[i] = 1
+                x_speed = x_speeds[i]
+                y_speed = y_speeds[i]
+
+                # Dying worms move slower
+                waiting = False
+                if life_left < dying_boundary:
+                    if wait_moves[i] == 0:
+                        wait_moves[i] = -(-((dying_boundary - life_left) * age_slowdown) // dying_boundary) + 1
+                    wait_moves[i] -= 1
+                    waiting = wait_moves[i] > 0
+                if not waiting:
+                    x += x_speed
+                    y += y_speed
+
+                mask = edges[x * height + y]
+                ramming = mask & HEADING_EDGES[(x_speed + 1) * 3 + y_speed + 1]
+                turn_threshold = kind.edge_turn_threshold if mask else kind.turn_threshold
+                if ramming or next16(state) < turn_threshold:
+                    if x_speed != 0:
+                        x_speed = 0
+                        y_speed = TURN_Y[mask]
+                        if y_speed == 0:
+                            if flags & KIND_FIXED_TURN:
+                                y_speed = 1
+                            else:
+                                y_speed = -1 if next16(state) < HALF else 1
+                    elif y_speed != 0:
+                        y_speed = 0
+                        x_speed = TURN_X[mask]
+                        if x_speed == 0:
+                            if flags & KIND_FIXED_TURN:
+                                x_speed = 1
+                            else:
+                                x_speed = -1 if next16(state) < HALF else 1
+
+                x_speeds[i] = x_speed
+                y_speeds[i] = y_speed
+
+            # Draw the head in its color of the frame, faded when dying
+            tables = kind.color_tables
+            table = tables[age % len(tables)]
+            step = ((dying_boundary - life_left) * color_steps) // dying_boundary
+            leds.set_led_color(x, y, table[min(max(step, 0), color_steps)])
+
+            if moved:
+                # Like RedHeadWorm, the body goes where the head was, after drawing the head
+                if flags & KIND_BODY:
+                    leds.set_led_color(xs[i], ys[i], kind.body_color, ignore_add=True)
+                xs[i] = x
+                ys[i] = y
+                age += 1
+            if age >= max_age:
+                self.remove_worm(i)
+            else:
+                ages[i] = age
+                i += 1
+
+    # Buckets every worm in its block of the panel
+    @micropython.native
+    def fill_grid(self):
+        first = self.grid_first
+        following = self.grid_next
+        columns = self.grid_columns
+        xs = self.x
+        ys = self.y
+        for cell in range(len(first)):
+            first[cell] = -1
+        for i in range(self.count):
+            cell = (ys[i] // GRID_CELL_SIZE) * columns + xs[i] // GRID_CELL_SIZE
+            following[i] = first[cell]
+            first[cell] = i
+
+    # The worm closest to worm i (counting steps), or -1. Searches rings of blocks around
+    # it like SpatialGrid.nearest and stops when no worm further out can be closer.
+    @micropython.native
+    def nearest(self, i):
+        first = self.grid_first
+        following = self.grid_next
+        columns = self.grid_columns
+        rows = self.grid_rows
+        xs = self.x
+        ys = self.y
+        x = xs[i]
+        y = ys[i]
+        center_column = x // GRID_CELL_SIZE
+        center_row = y // GRID_CELL_SIZE
+        closest = -1
+        closest_distance = 0
+        for ring in range(max(columns, rows)):
+            ring_distance = (ring - 1) * GRID_CELL_SIZE + 1 if ring > 0 else 0
+            if closest >= 0 and closest_distance < ring_distance:
+                break
+            for row in range(center_row - ring, center_row + ring + 1):
+                if row < 0 or row >= rows:
+                    continue
+                on_edge_row = row == center_row - ring or row == center_row + ring
+                step = 1 if on_edge_row else 2 * ring
+                column = center_column - ring
+                while column <= center_column + ring:
+                    if 0 <= column < columns:
+                        other = first[row * columns + column]
+                        while other >= 0:
+                            if other != i:
+                                distance = abs(xs[other] - x) + abs(ys[other] - y)
+                                if closest < 0 or distance < closest_distance:
+                                    closest = other
+                                    closest_distance = distance
+                            other = following[other]
+                    column += step
+        return closest
+
+    # Points chasing worms at the closest worm and scared worms away from it, after all
+    # worms moved. Same rules as ChasingWorm.move and ScaredWorm.move.
+    @micropython.native
+    def seek(self):
+        self.fill_grid()
+        kinds = self.kinds
+        worm_kinds = self.kind
+        xs = self.x
+        ys = self.y
+        x_speeds = self.x_speed
+        y_speeds = self.y_speed
+        edges = self.unicorn_leds.geometry.edge_mask(self.height_adjust)
+        height = self.unicorn_leds.uni_height
+        speed = Worm.DEFAULT_SPEED
+        for i in range(self.count):
+            kind = kinds[worm_kinds[i]]
+            flags = kind.flags
+            if not flags & (KIND_CHASE | KIND_FLEE):
+                continue
+            x = xs[i]
+            y = ys[i]
+            if flags & KIND_FLEE and edges[x * height + y]:
+                continue
+            other = self.nearest(i)
+            if other < 0:
+                continue
+            other_x = xs[other]
+            other_y = ys[other]
+            if flags & KIND_CHASE:
+                # Only chase if further away than 2 spaces
+                if other_x > x + 2:
+                    x_speeds[i] = speed
+                    y_speeds[i] = 0
+                elif other_x < x - 2:
+                    x_speeds[i] = -speed
+                    y_speeds[i] = 0
+                elif other_y > y + 2:
+                    y_speeds[i] = speed
+                    x_speeds[i] = 0
+                elif other_y < y - 2:
+                    y_speeds[i] = -speed
+                    x_speeds[i] = 0
+            else:
+                scare = kind.scare_factor
+                if x <= other_x <= x + scare:
+                    x_speeds[i] = -speed
+                    y_speeds[i] = 0
+                elif x >= other_x >= x - scare:
+                    x_speeds[i] = speed
+                    y_speeds[i] = 0
+                if y <= other_y <= y + scare:
+                    y_speeds[i] = -speed
+                    x_speeds[i] = 0
+                elif y >= other_y >= y - scare:
+                    y_speeds[i] = speed
+                    x_speeds[i] = 0
+
+    # Takes out the youngest worm
+    def shoot_worm(self):
+        if self.count == 0:
+            return
+        birth = self.birth
+        youngest = 0
+        for i in range(1, self.count):
+            if birth[i] > birth[youngest]:
+                youngest = i
+        self.remove_worm(youngest)
+
+    # Same rules as LifeAndDeath.procreate
+    def procreate(self, always=False):
+        if always or self.policy.wants_birth(self.count):
+            self.add_worm()
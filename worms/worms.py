@@ -1,18 +1,20 @@
-import random
 import sys
 
 from math import ceil
 
 import micropython
 
+from worms import board_geometry
+from worms.board_geometry import HEADING_EDGES, TURN_X, TURN_Y
+from worms.fastrand import HALF, rng, threshold
 from worms.led import Led
 from worms.unicorn_leds import UnicornLeds
 
 class Worm:
-    EDGE_LEFT = 1
-    EDGE_RIGHT = 2
-    EDGE_TOP = 3
-    EDGE_BOTTOM = 4
+    EDGE_LEFT = board_geometry.EDGE_LEFT
+    EDGE_RIGHT = board_geometry.EDGE_RIGHT
+    EDGE_TOP = board_geometry.EDGE_TOP
+    EDGE_BOTTOM = board_geometry.EDGE_BOTTOM
 
     # How long the worm can live
     MAX_AGE = 5000
@@ -25,19 +27,43 @@ class Worm:
 
     DEFAULT_SPEED = 1
 
-    def __init__(self, leds: UnicornLeds, worms=None, height_adjust=1):
+    # How likely a newborn worm is of this class, relative to the other classes
+    BIRTH_WEIGHT = 1
+
+    # In how many steps the color of a dying worm fades out
+    AGE_COLOR_STEPS = 32
+
+    # Faded colors for every base color in use, shared by all worm classes
+    age_color_tables = {}
+
+    def __init__(self, leds: UnicornLeds, worms=None, height_adjust=1, grid=None, trails=None):
         self.led_manager = leds
-        self.x = random.randint(0, leds.uni_width - 2)
+        self.worms = worms if worms else []
+        self.height_adjust = height_adjust
+        self.grid = grid
+        self.grid_cell = -1
+        # Set by LifeAndDeath when the worm is born, higher is younger
+        self.birth = 0
+        # Edge bits of every led this worm can be on, see BoardGeometry
+        self.edges = leds.geometry.edge_mask(height_adjust)
+        # In trail mode the worm has a body instead of a fading trail, see worms/trails.py
+        self.trails = trails
+        self.body = trails.make_body() if trails else None
+        self.reset()
+
+    # Gives the worm a fresh life. Also used to bring back a pooled worm after it died.
+    def reset(self):
+        leds = self.led_manager
+        self.x = rng.randint(0, leds.uni_width - 2)
         self.x_speed = self.DEFAULT_SPEED
-        self.y = random.randint(height_adjust, leds.uni_height - 1)
+        self.y = rng.randint(self.height_adjust, leds.uni_height - 1)
         self.y_speed = 0
         self.turn_chance = 0.25
         self.worm_color = Led.BLUE
         self.age = 0
         self.wait_move = 0
-        self.worms = worms if worms else []
-        self.height_adjust = height_adjust
         self.init_worm()
+        self.turn_threshold = threshold(self.turn_chance)
 
     def init_worm(self):
         pass
@@ -67,28 +93,54 @@ class Worm:
             self.y = self.y + self.y_speed
 
         # Consider turning - this will not move us, only point the worm in another direction
-        if self.is_ramming_edge() or self.want_to_turn():
+        if self.is_ramming_edge() or self.want_to_turn() or self.is_blocked():
+            x_speed = self.x_speed
+            y_speed = self.y_speed
             self.turn()
+            if self.trails and not self.is_ramming_edge() and self.is_blocked():
+                # Try turning the other way, then going straight on. Only a boxed in
+                # worm crawls over a worm.
+                self.steer(-self.x_speed, -self.y_speed)
+                if self.is_blocked():
+                    self.steer(x_speed, y_speed)
         self.draw_head(self.get_worm_color())
         if self.age < sys.maxsize - 1:
             self.age += 1
 
     def get_worm_color(self):
-        life_left = self.life_left()
-        if life_left < self.DYING_BOUNDARY:
+        if self.is_dying():
             return self.age_worm_color(self.worm_color)
         else:
             return self.worm_color
 
+    # Looks up the faded version of a color for the current age of the worm
     @micropython.native
     def age_worm_color(self, color):
+        table = Worm.age_color_tables.get(color)
+        if table is None:
+            table = self.build_age_color_table(color)
+        step = ((self.DYING_BOUNDARY - self.life_left()) * self.AGE_COLOR_STEPS) // self.DYING_BOUNDARY
+        if step <= 0:
+            return table[0]
+        if step >= self.AGE_COLOR_STEPS:
+            return table[self.AGE_COLOR_STEPS]
+        return table[step]
+
+    # Precomputes every fade step of a color, indexed by how far the worm is into dying
+    @classmethod
+    def build_age_color_table(cls, color):
+        table = tuple(cls.fade_color(color, step, cls.AGE_COLOR_STEPS) for step in range(cls.AGE_COLOR_STEPS + 1))
+        Worm.age_color_tables[color] = table
+        return table
+
+    @staticmethod
+    def fade_color(color, step, steps):
         new_color = []
         average = sum(color) / len(color)
-        invert_life_left = self.DYING_BOUNDARY - self.life_left()
 
         # Calculate how much to add or substract from each color to
         # make the worm appear to fade out
-        fraction = round((average * invert_life_left) / self.DYING_BOUNDARY)
+        fraction = round((average * step) / steps)
         for i in range(3):
             current_color = color[i]
             if current_color > average:
@@ -99,68 +151,81 @@ class Worm:
                 current_color = min(current_color + fraction, average)
             # Finally, fade the entire color down
             new_color.append(round(max(current_color - fraction, 0)))
-        return new_color
+        return tuple(new_color)
 
     def draw_head(self, color):
         try:
-            self.led_manager.set_led_color(self.x, self.y, color)
+            if self.trails:
+                if not (0 <= self.x < self.led_manager.uni_width and 0 <= self.y < self.led_manager.uni_height):
+                    raise IndexError("led out of range")
+                self.trails.advance(self.body, self.x * self.led_manager.uni_height + self.y, color)
+            else:
+                self.led_manager.set_led_color(self.x, self.y, color)
         except IndexError:
             raise Exception(
                 f"{__class__.__name__} out of bounds with X {self.x}, speed {self.x_speed}, Y {self.y}, speed {self.y_speed}"
             )
 
+    # Paints a led of the body, one the worm has already left. In trail mode only leds
+    # the body still covers, the others are not the worm's to paint.
+    def draw_body(self, x, y, color):
+        if self.trails:
+            led = x * self.led_manager.uni_height + y
+            if (x, y) != (self.x, self.y) and self.body.covers(led):
+                self.led_manager.paint(led, color)
+        else:
+            self.led_manager.set_led_color(x, y, color, ignore_add=True)
+
+    # Takes the body off the panel, when the worm dies or gets shot
+    def clear_body(self):
+        if self.body:
+            self.trails.clear(self.body)
+
+    # In trail mode, whether a worm is in the way of the next step
+    @micropython.native
+    def is_blocked(self):
+        if not self.trails:
+            return False
+        return self.trails.is_blocked(self.body, (self.x + self.x_speed) * self.led_manager.uni_height + self.y + self.y_speed)
+
+    # Points the worm in a new direction, unless in trail mode an edge or a worm is in
+    # the way there
+    def steer(self, x_speed, y_speed):
+        old_x_speed = self.x_speed
+        old_y_speed = self.y_speed
+        self.x_speed = x_speed
+        self.y_speed = y_speed
+        if self.trails and (self.is_ramming_edge() or self.is_blocked()):
+            self.x_speed = old_x_speed
+            self.y_speed = old_y_speed
+
+    # The edge bits of the led the worm is on
+    @micropython.native
+    def edge_bits(self):
+        return self.edges[self.x * self.led_manager.uni_height + self.y]
+
     @micropython.native
     def is_touching_edge(self, edge):
-        is_touching = False
-        if edge == self.EDGE_LEFT:
-            is_touching = self.x == 0
-        elif edge == self.EDGE_RIGHT:
-            is_touching = self.x >= self.led_manager.uni_width - 1
-        elif edge == self.EDGE_BOTTOM:
-            is_touching = self.y == self.height_adjust
-        elif edge == self.EDGE_TOP:
-            is_touching = self.y >= self.led_manager.uni_height - 1
-        return is_touching
+        return self.edge_bits() & edge != 0
 
     @micropython.native
     def is_touching_any_edge(self):
-        is_touching = False
-        for is_touching_now in [
-            self.EDGE_LEFT,
-            self.EDGE_TOP,
-            self.EDGE_RIGHT,
-            self.EDGE_BOTTOM,
-        ]:
-            is_touching = is_touching or self.is_touching_edge(is_touching_now)
-        return is_touching
+        return self.edge_bits() != 0
 
     @micropython.native
     def is_ramming_edge(self):
-        return (
-            (self.is_touching_edge(self.EDGE_LEFT) and self.x_speed < 0)
-            or (self.is_touching_edge(self.EDGE_RIGHT) and self.x_speed > 0)
-            or (self.is_touching_edge(self.EDGE_BOTTOM) and self.y_speed < 0)
-            or (self.is_touching_edge(self.EDGE_TOP) and self.y_speed > 0)
-        )
+        return self.edge_bits() & HEADING_EDGES[(self.x_speed + 1) * 3 + self.y_speed + 1] != 0
 
     @micropython.native
     def turn(self):
         if self.x_speed != 0:
             self.x_speed = 0
-            if self.is_touching_edge(self.EDGE_BOTTOM):
-                self.y_speed = self.DEFAULT_SPEED
-            elif self.is_touching_edge(self.EDGE_TOP):
-                self.y_speed = -self.DEFAULT_SPEED
-            else:
-                self.y_speed = self.decide_up_or_down()
+            forced = TURN_Y[self.edge_bits()]
+            self.y_speed = forced * self.DEFAULT_SPEED if forced else self.decide_up_or_down()
         elif self.y_speed != 0:
             self.y_speed = 0
-            if self.is_touching_edge(self.EDGE_LEFT):
-                self.x_speed = self.DEFAULT_SPEED
-            elif self.is_touching_edge(self.EDGE_RIGHT):
-                self.x_speed = -self.DEFAULT_SPEED
-            else:
-                self.x_speed = self.decide_left_or_right()
+            forced = TURN_X[self.edge_bits()]
+            self.x_speed = forced * self.DEFAULT_SPEED if forced else self.decide_left_or_right()
 
     def die(self):
         self.age = self.MAX_AGE
@@ -175,13 +240,30 @@ class Worm:
         return self.life_left() < self.DYING_BOUNDARY
 
     def want_to_turn(self):
-        return random.random() < self.turn_chance
+        return rng.chance(self.turn_threshold)
+
+    def distance_to(self, worm):
+        return abs(self.x - worm.x) + abs(self.y - worm.y)
+
+    # Asks the shared grid for the closest other worm, or checks all worms if there is no grid
+    def find_closest_worm(self):
+        if self.grid:
+            return self.grid.nearest(self.x, self.y, exclude=self)
+        closest_worm = None
+        closest_distance = 0
+        for worm in self.worms:
+            if worm is not self:
+                distance = self.distance_to(worm)
+                if not closest_worm or distance < closest_distance:
+                    closest_worm = worm
+                    closest_distance = distance
+        return closest_worm
 
     def decide_up_or_down(self):
-        return 1 if random.random() > 0.5 else -1
+        return -1 if rng.chance(HALF) else 1
 
     def decide_left_or_right(self):
-        return 1 if random.random() > 0.5 else -1
+        return -1 if rng.chance(HALF) else 1
 
 
 class TurnyWorm(Worm):
@@ -199,26 +281,27 @@ class StraightWorm(Worm):
 class WallWorm(Worm):
     def init_worm(self):
         self.small_turn_chance = 0.1
+        self.small_turn_threshold = threshold(self.small_turn_chance)
         self.turn_chance = 0.6
         self.worm_color = Led.GREEN
 
     def want_to_turn(self):
         if self.is_touching_any_edge():
-            return random.random() < self.small_turn_chance
+            return rng.chance(self.small_turn_threshold)
         else:
-            return random.random() < self.turn_chance
+            return rng.chance(self.turn_threshold)
 
 
 class RainbowWorm(Worm):
     RAINBOW_COLORS = [Led.RED, Led.ORANGE, Led.YELLOW, Led.GREEN, Led.BLUE, Led.PURPLE]
+    DIMMED_RAINBOW_COLORS = [tuple(max(rgb - 50, 0) for rgb in color) for color in RAINBOW_COLORS]
 
     def init_worm(self):
         self.turn_chance = 0.3
         self.rainbow_index = 0
 
     def get_worm_color(self):
-        color = self.RAINBOW_COLORS[self.rainbow_index]
-        color = [max(rgb - 50, 0) for rgb in color]
+        color = self.DIMMED_RAINBOW_COLORS[self.rainbow_index]
         self.rainbow_index += 1
         self.rainbow_index %= len(self.RAINBOW_COLORS)
         color = self.age_worm_color(color)
@@ -255,9 +338,7 @@ class RedHeadWorm(Worm):
         self.last_x = self.x
         self.last_y = self.y
         super(RedHeadWorm, self).move()
-        self.led_manager.set_led_color(
-            self.last_x, self.last_y, list(self.worm_body_color), ignore_add=True
-        )
+        self.draw_body(self.last_x, self.last_y, self.worm_body_color)
 
     def decide_up_or_down(self):
         return 1
@@ -274,32 +355,18 @@ class ChasingWorm(Worm):
     def move(self):
         super().move()
         # This worm tries to find another worm and chase that
-        closest_worm = None
-        for worm in self.worms:
-            if worm != self:
-                # Find the closest worm
-                if not closest_worm or self.distance_to(worm) < self.distance_to(
-                    closest_worm
-                ):
-                    closest_worm = worm
+        closest_worm = self.find_closest_worm()
 
         # Only chase if further away than 2 spaces
         if closest_worm:
             if closest_worm.x > (self.x + 2):
-                self.x_speed = self.DEFAULT_SPEED
-                self.y_speed = 0
+                self.steer(self.DEFAULT_SPEED, 0)
             elif closest_worm.x < (self.x - 2):
-                self.x_speed = -self.DEFAULT_SPEED
-                self.y_speed = 0
+                self.steer(-self.DEFAULT_SPEED, 0)
             elif closest_worm.y > (self.y + 2):
-                self.y_speed = self.DEFAULT_SPEED
-                self.x_speed = 0
+                self.steer(0, self.DEFAULT_SPEED)
             elif closest_worm.y < (self.y - 2):
-                self.y_speed = -self.DEFAULT_SPEED
-                self.x_speed = 0
-
-    def distance_to(self, worm):
-        return abs(self.x - worm.x) + abs(self.y - worm.y)
+                self.steer(0, -self.DEFAULT_SPEED)
 
     def get_worm_color(self):
         color = self.worm_second_color if self.age % 2 == 0 else self.worm_color
@@ -317,33 +384,26 @@ class ScaredWorm(Worm):
         super().move()
         # This worm tries to find another worm and chase that
         if not self.is_touching_any_edge():
-            closest_worm = None
-            for worm in self.worms:
-                if worm != self:
-                    # Find the closest worm
-                    if not closest_worm or self.distance_to(worm) < self.distance_to(
-                        closest_worm
-                    ):
-                        closest_worm = worm
+            closest_worm = self.find_closest_worm()
 
             # Only chase if further away than 2 spaces
             if closest_worm:
+                x_speed = self.x_speed
+                y_speed = self.y_speed
                 if self.x <= closest_worm.x <= (self.x + self.scare_factor):
-                    self.x_speed = -self.DEFAULT_SPEED
-                    self.y_speed = 0
+                    x_speed = -self.DEFAULT_SPEED
+                    y_speed = 0
                 elif self.x >= closest_worm.x >= (self.x - self.scare_factor):
-                    self.x_speed = self.DEFAULT_SPEED
-                    self.y_speed = 0
+                    x_speed = self.DEFAULT_SPEED
+                    y_speed = 0
 
                 if self.y <= closest_worm.y <= (self.y + self.scare_factor):
-                    self.y_speed = -self.DEFAULT_SPEED
-                    self.x_speed = 0
+                    y_speed = -self.DEFAULT_SPEED
+                    x_speed = 0
                 elif self.y >= closest_worm.y >= (self.y - self.scare_factor):
-                    self.y_speed = self.DEFAULT_SPEED
-                    self.x_speed = 0
-
-    def distance_to(self, worm):
-        return abs(self.x - worm.x) + abs(self.y - worm.y)
+                    y_speed = self.DEFAULT_SPEED
+                    x_speed = 0
+                self.steer(x_speed, y_speed)
 
     def get_worm_color(self):
         color = self.worm_second_color if self.age % 2 == 0 else self.worm_color
@@ -360,3 +420,10 @@ worm_collection = [
     RainbowWorm,
     RedHeadWorm,
 ]
+
+# The colors worms fade out from when they die. Their fade tables are built up front,
+# instead of halfway through a frame. Any other color gets its table on first use.
+AGED_COLORS = [Led.RED, Led.GREEN, Led.BLUE, Led.PURPLE, Led.GREY, Led.WHITE] + RainbowWorm.DIMMED_RAINBOW_COLORS
+
+for color in AGED_COLORS:
+    Worm.build_age_color_table(color)